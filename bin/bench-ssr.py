@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+
+#
+# README
+#
+# This Python script benchmarks generate-ssr.py without a real NELDB database.
+#
+# HOW TO USE:
+#
+# 1. Generate synthetic databases
+#
+#    $ python bench-ssr.py generate --items 10000 --items 1000000 --output-dir bench-db
+#
+#    The script writes bench-db/xml_DB_S10000/instancesHierarchy.xml and
+#    bench-db/xml_DB_S1000000/instancesHierarchy.xml. Each file is shaped like a real
+#    instancesHierarchy.xml (location -> system -> equipment -> aii/dii/sii points)
+#    and contains about the given number of HierarchyItem elements.
+#
+# 2. Benchmark SSR generation
+#
+#    $ python bench-ssr.py run --xml-dir bench-db --engine tree --engine stream
+#
+#    For each synthetic database under --xml-dir and each engine, the script times the stages of
+#    SSR generation (parse, query, parents, sort and write) for all location and system pairs, and
+#    reports throughput (HierarchyItem elements or points per second) and peak memory of each stage.
+#    The stream engine parses and queries at the same time, so its parse stage includes querying.
+#    The walk engines query all location and system pairs in one walk over the tree (walk) or over
+#    the compact form of the database (compact-walk).
+#    The lxml engines parse databases with lxml instead of ElementTree (tree and walk, respectively);
+#    they are skipped when lxml is not installed. tracemalloc does not see memory allocated by lxml.
+#    The expat engines load databases into the arrays of ArrayHierarchy with expat callbacks instead
+#    of ElementTree elements (tree and walk, respectively).
+#    Peak memory is measured by tracemalloc, which slows down every stage; specify `--no-memory`
+#    option to measure time only.
+#
+#    When --xml-dir is not given, databases of the sizes given by --items are generated in a
+#    temporary directory first.
+#
+# 3. Benchmark sorting
+#
+#    $ python bench-ssr.py sort --points 100000
+#
+#    The script sorts a synthetic list of points the way generate-ssr.py used to
+#    (sort(key=cmp_to_key(locale.strcoll))) and the way it does now (sort_points()),
+#    checks that both give the same order and reports the time taken by each.
+#
+#    Specify `--locale` option to benchmark under a specific collation locale (e.g., en_US.UTF-8).
+#    By default, the collation locale is "C", which is what generate-ssr.py runs with.
+#
+
+import argparse
+import glob
+import importlib.util
+import locale
+import logging
+import os
+import os.path
+import random
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from functools import cmp_to_key
+from xml.sax.saxutils import quoteattr
+
+logger = logging.getLogger("bench-ssr")
+
+# Shape of synthetic databases
+_locations = ["BGK", "BNK", "CNT", "CQY", "DBG", "FRP", "HBF", "HGN", "KVN", "LTI", "OTP", "PGC"]
+_systems = ["BMF", "CCTS_0001", "DC___0001", "ECS", "FPS__0001", "HV___0001", "PASS_0001", "TRAS"]
+_point_names = ["Alarm", "Fault", "Mode", "Status", "Temp", "Trip"]
+_points_per_equipment = 8
+
+# Engines to be benchmarked
+_engines = ["tree", "compact", "walk", "compact-walk", "stream", "lxml", "lxml-walk", "expat", "expat-walk"]
+
+
+def load_generate_ssr():
+    """
+    Load generate-ssr.py script from the same directory as a module
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate-ssr.py")
+    spec = importlib.util.spec_from_file_location("generate_ssr", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_points(count, seed=0):
+    """
+    Returns a list of points shaped like points in SSR files (e.g., BGK_BMF_EQ0001:aiiTemp1)
+    """
+    rng = random.Random(seed)
+    points = []
+    for i in range(count):
+        equipment = f"{rng.choice(_locations)}_{rng.choice(_systems)}_EQ{rng.randrange(10000):04d}"
+        points.append(f"{equipment}:{rng.choice(['aii', 'dii'])}{rng.choice(_point_names)}{i % 10}")
+    return points
+
+
+def generate_hierarchy(xml_file, items, seed=0):
+    """
+    Write a synthetic instancesHierarchy.xml file with about a given number of HierarchyItem elements
+
+    Returns the number of HierarchyItem elements written.
+    """
+    rng = random.Random(seed)
+    pairs = len(_locations) * len(_systems)
+    equipment_count = max(1, (items - len(_locations) - pairs) // (pairs * (1 + _points_per_equipment)))
+
+    count = 0
+    with open(xml_file, "w", encoding="utf-8") as outfile:
+        outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        outfile.write("<InstancesHierarchy>\n")
+        for location in _locations:
+            outfile.write(f"  <HierarchyItem name={quoteattr(location)} alias={quoteattr(location)}>\n")
+            count += 1
+            for system in _systems:
+                system_alias = f"{location}_{system}"
+                outfile.write(
+                    f"    <HierarchyItem name={quoteattr(system)} alias={quoteattr(system_alias)}>\n"
+                )
+                count += 1
+                for i in range(equipment_count):
+                    equipment = f"EQ{i:04d}"
+                    equipment_alias = f"{system_alias}_{equipment}"
+                    outfile.write(
+                        f"      <HierarchyItem name={quoteattr(equipment)} alias={quoteattr(equipment_alias)}>\n"
+                    )
+                    count += 1
+                    for j in range(_points_per_equipment):
+                        name = f"{rng.choice(['aii', 'dii', 'sii'])}{rng.choice(_point_names)}{j}"
+                        alias = f"{equipment_alias}_{name}"
+                        outfile.write(
+                            f"        <HierarchyItem name={quoteattr(name)} alias={quoteattr(alias)}/>\n"
+                        )
+                        count += 1
+                    outfile.write("      </HierarchyItem>\n")
+                outfile.write("    </HierarchyItem>\n")
+            outfile.write("  </HierarchyItem>\n")
+        outfile.write("</InstancesHierarchy>\n")
+    return count
+
+
+def generate_databases(output_dir, sizes):
+    """
+    Write a synthetic database (xml_DB_S<size>) for each of given sizes
+    """
+    for items in sizes:
+        database = f"S{items}"
+        os.makedirs(f"{output_dir}/xml_DB_{database}", exist_ok=True)
+        xml_file = f"{output_dir}/xml_DB_{database}/instancesHierarchy.xml"
+        count = generate_hierarchy(xml_file, items)
+        logger.info(f"{count} HierarchyItem elements written to {xml_file}")
+
+
+def synthetic_configs(database):
+    """
+    Returns SSR configurations of all location and system pairs of a synthetic database
+    """
+    return [
+        {
+            "database": database,
+            "environ": f"{location}SMS",
+            "location": location,
+            "system": system,
+            "output_dir": database.lower(),
+            "output": f"{location}-{system}",
+        }
+        for location in _locations
+        for system in _systems
+    ]
+
+
+@contextmanager
+def measure(stage, results, memory=True):
+    """
+    Measure time and peak memory (MiB) of a stage into results
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[stage] = {"time": time.perf_counter() - start, "memory": None}
+        if memory:
+            results[stage]["memory"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+
+def bench_engine(ssr, xml_dir, database, engine, memory=True):
+    """
+    Benchmark the stages of SSR generation of a database with a given engine
+    """
+    xml_file = ssr.hierarchy_file(xml_dir, database)
+    db_list = synthetic_configs(database)
+    results = {}
+
+    # Time spent on querying and on resolving parents is split by the timings of generate-ssr.py.
+    # Peak memory of both stages is reported in the first stage.
+    timings = ssr.new_timings()
+    if engine == "stream":
+        # The stream engine parses and queries at the same time
+        with measure("parse", results, memory):
+            all_points = ssr.stream_points(xml_file, db_list, timings)
+        results["parse"]["time"] = timings["parse"]
+    else:
+        with measure("parse", results, memory):
+            if engine.startswith("compact"):
+                index = ssr.CompactHierarchy.from_file(xml_file)
+            elif engine.startswith("expat"):
+                index = ssr.ArrayHierarchy.from_file(xml_file)
+            elif engine.startswith("lxml"):
+                index = ssr.LxmlHierarchyIndex(ssr.lxml_etree.parse(xml_file))
+            else:
+                index = ssr.HierarchyIndex(ET.parse(xml_file))
+        with measure("query", results, memory):
+            if engine.endswith("walk"):
+                all_points = ssr.route_points(index, db_list, timings)
+            else:
+                all_points = [ssr.extract_points(index, db, timings) for db in db_list]
+        results["query"]["time"] = timings["query"]
+    results["parents"] = {"time": timings["parents"], "memory": None}
+
+    with measure("sort", results, memory):
+        for db_points in all_points:
+            ssr.sort_points(db_points)
+    with tempfile.TemporaryDirectory() as output_dir:
+        with measure("write", results, memory):
+            for db, db_points in zip(db_list, all_points):
+                ssr.write_ssr_file(db_points, db.get("environ"), f"{output_dir}/{db.get('output')}.dat")
+
+    return results, sum(len(db_points) for db_points in all_points)
+
+
+def count_items(xml_file):
+    """
+    Returns the number of HierarchyItem elements in a XML file
+    """
+    count = 0
+    for _, elem in ET.iterparse(xml_file):
+        if elem.tag == "HierarchyItem":
+            count += 1
+        elem.clear()
+    return count
+
+
+def bench_run(ssr, xml_dir, engines, memory=True):
+    """
+    Benchmark all synthetic databases under xml_dir with given engines
+    """
+    for path in sorted(glob.glob(f"{xml_dir}/xml_DB_*/instancesHierarchy.xml")):
+        database = os.path.basename(os.path.dirname(path))[len("xml_DB_") :]
+        items = count_items(path)
+        for engine in engines:
+            results, points = bench_engine(ssr, xml_dir, database, engine, memory)
+            logger.info(f"{database}: {items} items, {points} points, {engine} engine")
+            for stage in ssr._stages:
+                if stage not in results:
+                    continue
+                elapsed = results[stage]["time"]
+                count = items if stage in ["parse", "query", "parents"] else points
+                line = f"  {stage:<8} {elapsed:10.4f}s {count / max(elapsed, 1e-9):14.0f}/s"
+                if results[stage]["memory"] is not None:
+                    line += f" {results[stage]['memory']:10.2f} MiB"
+                logger.info(line)
+
+
+def timed(func, *args):
+    """
+    Returns the time taken by calling a function with given arguments
+    """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def strcoll_sort(points):
+    """
+    Sort points the way generate-ssr.py used to
+    """
+    points.sort(key=cmp_to_key(locale.strcoll))
+
+
+def bench_sort(ssr, count, repeat):
+    """
+    Benchmark sorting a list of points with strcoll comparisons and with sort_points()
+    """
+    points = synthetic_points(count)
+
+    strcoll_time = float("inf")
+    sort_points_time = float("inf")
+    for _ in range(repeat):
+        expected = list(points)
+        strcoll_time = min(strcoll_time, timed(strcoll_sort, expected))
+
+        ssr.collation_key.cache_clear()
+        actual = list(points)
+        sort_points_time = min(sort_points_time, timed(ssr.sort_points, actual))
+
+        if actual != expected:
+            logger.error("sort_points() does not give the same order as strcoll")
+
+    logger.info(f"Sorting {count} points (collation: {locale.setlocale(locale.LC_COLLATE)})")
+    logger.info(f"  cmp_to_key(strcoll): {strcoll_time:0.4f}s")
+    logger.info(f"  sort_points():       {sort_points_time:0.4f}s ({strcoll_time / sort_points_time:0.1f}x)")
+
+
+def main():
+    """
+    main function
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(prog="bench-ssr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="generate synthetic databases")
+    run_parser = subparsers.add_parser("run", help="benchmark SSR generation")
+    for subparser in [generate_parser, run_parser]:
+        subparser.add_argument(
+            "--items",
+            "-n",
+            required=False,
+            type=int,
+            action="append",
+            dest="items",
+            help="number of HierarchyItem elements in a synthetic database; can be repeated "
+            "(default=10000 and 100000)",
+        )
+    generate_parser.add_argument(
+        "--output-dir",
+        "-o",
+        required=True,
+        dest="output_dir",
+        help="path to output directory",
+    )
+    run_parser.add_argument(
+        "--xml-dir",
+        "-x",
+        required=False,
+        default="",
+        dest="xml_dir",
+        help="path to XML directories; "
+        "by default, synthetic databases are generated in a temporary directory",
+    )
+    run_parser.add_argument(
+        "--engine",
+        required=False,
+        choices=_engines,
+        action="append",
+        dest="engines",
+        help="engine to be benchmarked; can be repeated (default=all engines)",
+    )
+    run_parser.add_argument(
+        "--no-memory",
+        required=False,
+        action="store_false",
+        dest="memory",
+        help="do not measure peak memory of each stage",
+    )
+
+    sort_parser = subparsers.add_parser("sort", help="benchmark sorting points")
+    sort_parser.add_argument(
+        "--points",
+        "-n",
+        required=False,
+        type=int,
+        default=100000,
+        dest="points",
+        help="number of points to be sorted (default=100000)",
+    )
+    sort_parser.add_argument(
+        "--repeat",
+        "-r",
+        required=False,
+        type=int,
+        default=3,
+        dest="repeat",
+        help="number of times each benchmark is repeated; the best time is reported (default=3)",
+    )
+    sort_parser.add_argument(
+        "--locale",
+        "-l",
+        required=False,
+        default="",
+        dest="locale",
+        help="collation locale to be used (e.g., en_US.UTF-8); by default, C locale is used",
+    )
+
+    args = parser.parse_args()
+
+    ssr = load_generate_ssr()
+    # Keep the log of each SSR file written by generate-ssr.py from flooding the benchmark results
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    if args.command == "sort":
+        if args.locale != "":
+            try:
+                locale.setlocale(locale.LC_COLLATE, args.locale)
+            except locale.Error:
+                logger.error(f"{args.locale} is not a valid locale")
+                return
+        bench_sort(ssr, args.points, args.repeat)
+        return
+
+    sizes = args.items or [10000, 100000]
+    if args.command == "generate":
+        generate_databases(args.output_dir, sizes)
+        return
+
+    engines = args.engines or _engines
+    if ssr.lxml_etree is None:
+        logger.warning("lxml is not installed; skipping lxml engines")
+        engines = [engine for engine in engines if not engine.startswith("lxml")]
+    if args.xml_dir != "":
+        bench_run(ssr, args.xml_dir, engines, args.memory)
+        return
+    with tempfile.TemporaryDirectory() as xml_dir:
+        generate_databases(xml_dir, sizes)
+        bench_run(ssr, xml_dir, engines, args.memory)
+
+
+if __name__ == "__main__":
+    main()
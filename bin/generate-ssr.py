@@ -53,8 +53,138 @@
 #    --pool 8:  693.4496 seconds (11.56 minutes; Intel Core i9-10900
 #    --pool 8:  396.0357 seconds  (6.60 minutes) Apple M1 Max
 #
+#    Jobs are submitted to the processes starting from the largest databases (e.g., CMS and ECS), so
+#    that the remaining processes are not left idle waiting for them at the end. Specify
+#    `--schedule static` option to submit jobs in the order of the configurations instead.
+#
+#    Many SSR files are generated from the same database (e.g., xml_DB_CMS is used by 80 SSR files).
+#    By default, each SSR file is generated by its own job, which parses instancesHierarchy.xml again.
+#    Specify `--group` option to run one job per database instead. Each job parses instancesHierarchy.xml
+#    only once and generates all SSR files of the database from it.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --output-dir ssr-out
+#
+#    With `--group` option, each job writes SSR files in a separate thread while it goes on with the next
+#    SSR file. Every SSR file is written to a temporary file first and then renamed, so an interrupted run
+#    never leaves a half written SSR file behind.
+#
+#    By default, the script loads entire instancesHierarchy.xml into memory. Specify `--engine stream`
+#    option to stream instancesHierarchy.xml instead. Only the current ancestor elements and the input
+#    points found so far are kept in memory, so memory usage stays flat as databases grow.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 8 --group --engine stream --output-dir ssr-out
+#
+#    With `--group` option, `--engine walk` option finds the input points of all SSR files of a database
+#    in one walk over instancesHierarchy.xml, instead of searching it again for every SSR file.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --engine walk --output-dir ssr-out
+#
+#    Even with `--group` option, a single large database (e.g., xml_DB_CMS) can keep one process busy long
+#    after the others are done. With `--engine walk` option, specify `--split` option to split each database
+#    that takes longer than its share of the processes into that many jobs. Each job walks its own set of
+#    locations (HierarchyItem elements named after the locations of the configurations, wherever they are)
+#    of the database, and the SSR files are written once all jobs of the database are done. `--split` option
+#    requires `--prefork` or `--cache-dir` option, so that the jobs do not parse the same database again.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --engine walk --split 4 --prefork --output-dir ssr-out
+#
+#    When lxml is installed (pip install lxml), tree and walk engines parse databases with lxml, which is
+#    faster than ElementTree and produces the same SSR files. Specify `--xml-backend etree` option to
+#    use ElementTree anyway. With `--cache-dir` option, databases are always cached by ElementTree.
+#
+#    Specify `--xml-backend expat` option to keep each database in flat arrays of numbers built directly
+#    from expat callbacks instead of an ElementTree element per HierarchyItem. It parses about as fast as
+#    ElementTree and takes a fraction of the memory, which helps with the largest databases (e.g., OCC CMS).
+#
+#    $ python generate-ssr.py --xml-dir . --pool 8 --group --engine walk --xml-backend expat --output-dir ssr-out
+#
+#    Specify `--cache-dir` option to keep a compact form of each instancesHierarchy.xml on disk.
+#    When the same database is processed again (e.g., after fixing one configuration entry),
+#    the script loads the cache instead of parsing XML files again.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --cache-dir ssr-cache --output-dir ssr-out
+#
+#    Each run records the source database, the configuration and the resulting points of every SSR file
+#    in a manifest next to the output directory (e.g., ssr-out.manifest.json). Specify `--incremental`
+#    option to only generate SSR files whose database or configuration changed since the previous run.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --incremental --output-dir ssr-out
+#
+#    Specify `--only` option to generate specific SSR files only (e.g., after a change at one station).
+#    It takes a file name (BGK-COM-PIS.dat), a path relative to the output directory (bgksms/BGK-COM-PIS.dat)
+#    or a glob pattern (bgksms/BGK-*.dat), and can be repeated. Only the databases of the selected SSR files
+#    are loaded; with `--cache-dir` option, a single SSR file is generated in well under a second.
+#
+#    $ python generate-ssr.py --xml-dir . --cache-dir ssr-cache --only BGK-COM-PIS.dat --output-dir ssr-out
+#
+#    Every SSR file has a timestamp in its header, so every run rewrites all SSR files. Specify
+#    `--skip-unchanged` option to leave an existing SSR file untouched when its points did not change.
+#    Only SSR files with new or removed points show up as modified in Subversion.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --skip-unchanged --output-dir ssr-out
+#
+#    Specify `--prefork` option to load all databases once before the processes are started. Under Linux,
+#    the processes share the loaded databases instead of parsing the same database in every process.
+#    Under macOS, processes are not forked, so each process still loads databases by itself.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 8 --prefork --output-dir ssr-out
+#
+#    Specify `--report` option to write how long each SSR file took to parse, query, resolve parents,
+#    sort and write, with its number of points and peak memory usage (RSS in MiB) of its process during
+#    its job. Under Linux, the peak is reset when each job starts; elsewhere, it is the peak of the whole
+#    life of the process, including earlier jobs in the same process.
+#    The report is written as CSV when the file name ends with .csv; otherwise, as JSON.
+#    Specify `--profile` option to dump cProfile stats of each job to a directory.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --report ssr-report.csv --output-dir ssr-out
+#
+#    Specify `--auto` option to discover SSR files from databases instead of the configurations below.
+#    Every system (a HierarchyItem directly under a location) with input points becomes a SSR file,
+#    named after the conventions of the configurations. The script reports systems that are not in
+#    the configurations and configurations whose systems are not found. Systems are discovered from
+#    the databases loaded by the engine (from `--cache-dir` when given), and under Linux, tree and walk
+#    engines generate SSR files from the same loaded databases without loading them again.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --auto --output-dir ssr-out
+#
+#    SSR files of OCC CMS (formerly generated by generate-ssr4.py) are written with a slightly different
+#    header. Each set of SSR files is an output profile: `station` (all SSR files; --output-dir) and `occ`
+#    (OCC CMS SSR files). Specify `--output-profile` option for each output profile to be generated into
+#    its own output directory. With `--group` option, all output profiles are generated from a single parse
+#    of each database. Only SSR files of `station` output profile are discovered by `--auto` option.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --output-dir ssr-out --output-profile occ=ssr4-out
+#
+#    Specify `--diff` option instead of `--output-dir` option to compare the SSR files with existing SSR files
+#    (e.g., hmi/Nel-gws/DatSsr) before committing them. No SSR files are written; the script logs a summary
+#    of new, changed and deleted SSR files with the number of added and removed points, and writes the
+#    added and removed points of each SSR file to standard output as JSON.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --diff ../DatSsr > ssr-diff.json
+#
+#    Specify `--watch` option to keep the script running after SSR files are generated. The script checks
+#    instancesHierarchy.xml files every two seconds (see `--interval` option) and, when a database changes,
+#    parses that database again in the main process and generates only its SSR files. Indexes are not kept
+#    between changes. Press Ctrl-C to stop.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 4 --group --skip-unchanged --watch --output-dir ssr-out
+#
+#    Each process keeps a whole database in memory while it works on it, and CMS or ECS databases can take
+#    gigabytes. Specify `--max-memory` option (in MiB) to start jobs only as long as their estimated peak
+#    memory fits into it altogether. Each process exits after its job, which releases its database. Peak memory
+#    of each database is measured and recorded in the manifest, so that the following runs estimate better.
+#
+#    $ python generate-ssr.py --xml-dir . --pool 8 --group --max-memory 8192 --output-dir ssr-out
+#
 #    You can get help by running the script with -h option.
+#    While SSR files are generated, the script logs the progress of jobs with an estimated time to complete.
 #    When the SSR file generation is complete, you will find the output under ssr-out directory.
+#    When any job fails, the script lists failed jobs at the end and exits with a non-zero status.
+#
+#    Steps 2 and 3 can be skipped: `--xml-dir` option also takes the compressed database file itself.
+#    Each process reads instancesHierarchy.xml files directly from the compressed database file.
+#
+#    $ python generate-ssr.py --xml-dir NELDB_MOCC_P22_P22.zip --pool 4 --group --output-dir ssr-out
 #
 # 6. Copy the newly generated SSR files to your local Subversion repository (hmi/Nel-gws/DatSsr)
 # 7. Commit your modifications to your remote Subversion repositsory for delivery
@@ -62,16 +192,46 @@
 
 
 import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import cProfile
+import csv
+import ctypes
+import fnmatch
+import gc
+import hashlib
+import itertools
+import json
 import locale
 import logging
 import logging.handlers
 import multiprocessing
 import os
 import os.path
+import pickle
+import queue
+import signal
+import sys
 import time
+import traceback
 import xml.etree.ElementTree as ET
+import xml.parsers.expat
+import zipfile
+from contextlib import contextmanager
 from datetime import datetime
-from functools import cmp_to_key
+from functools import lru_cache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml is optional
+    lxml_etree = None
 
 #
 # Configurations to extract data for SSR files from XML files
@@ -3819,6 +3979,163 @@ databases = [
     },
 ]
 
+# SSR files of OCC CMS (formerly generated by generate-ssr4.py)
+occ_databases = [
+    {
+        # BGK-BMF.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "OCCCMS",  # data written to BGK-BMF.dat file
+        "location": "BGK",
+        "system": "BMF",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BGK-BMF.dat to be written to this directory
+        "output": "BGK-BMF",
+    },
+    {
+        # BGK-COM-CCTV.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BGKSMS",  # data written to BGK-COM-CCTV.dat file
+        "location": "BGK",
+        "system": "CCTS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BGK-COM-CCTV.dat to be written to this directory
+        "output": "BGK-COM-CCTV",
+    },
+    {
+        # BGK-COM-PAS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BGKSMS",  # data written to BGK-COM-PAS.dat file
+        "location": "BGK",
+        "system": "PASS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BGK-COM-PAS.dat to be written to this directory
+        "output": "BGK-COM-PAS",
+    },
+    {
+        # BGK-COM-PIS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BGKSMS",  # data written to BGK-COM-PIS.dat file
+        "location": "BGK",
+        "system": "PISS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BGK-COM-PIS.dat to be written to this directory
+        "output": "BGK-COM-PIS",
+    },
+    #
+    {
+        # BNK-BMF.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "OCCCMS",  # data written to BNK-BMF.dat file
+        "location": "BNK",
+        "system": "BMF",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BNK-BMF.dat to be written to this directory
+        "output": "BNK-BMF",
+    },
+    {
+        # BNK-COM-CCTV.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BNKSMS",  # data written to BNK-COM-CCTV.dat file
+        "location": "BNK",
+        "system": "CCTS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BNK-COM-CCTV.dat to be written to this directory
+        "output": "BNK-COM-CCTV",
+    },
+    {
+        # BNK-COM-PAS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BNKSMS",  # data written to BNK-COM-PAS.dat file
+        "location": "BNK",
+        "system": "PASS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BNK-COM-PAS.dat to be written to this directory
+        "output": "BNK-COM-PAS",
+    },
+    {
+        # BNK-COM-PIS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "BNKSMS",  # data written to BNK-COM-PIS.dat file
+        "location": "BNK",
+        "system": "PISS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # BNK-COM-PIS.dat to be written to this directory
+        "output": "BNK-COM-PIS",
+    },
+    #
+    {
+        # CNT-BMF.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "OCCCMS",  # data written to CNT-BMF.dat file
+        "location": "CNT",
+        "system": "BMF",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CNT-BMF.dat to be written to this directory
+        "output": "CNT-BMF",
+    },
+    {
+        # CNT-COM-CCTV.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CNTSMS",  # data written to CNT-COM-CCTV.dat file
+        "location": "CNT",
+        "system": "CCTS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CNT-COM-CCTV.dat to be written to this directory
+        "output": "CNT-COM-CCTV",
+    },
+    {
+        # CNT-COM-PAS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CNTSMS",  # data written to CNT-COM-PAS.dat file
+        "location": "CNT",
+        "system": "PASS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CNT-COM-PAS.dat to be written to this directory
+        "output": "CNT-COM-PAS",
+    },
+    {
+        # CNT-COM-PIS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CNTSMS",  # data written to CNT-COM-PIS.dat file
+        "location": "CNT",
+        "system": "PISS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CNT-COM-PIS.dat to be written to this directory
+        "output": "CNT-COM-PIS",
+    },
+    #
+    {
+        # CQY-BMF.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "OCCCMS",  # data written to CQY-BMF.dat file
+        "location": "CQY",
+        "system": "BMF",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CQY-BMF.dat to be written to this directory
+        "output": "CQY-BMF",
+    },
+    {
+        # CQY-COM-CCTV.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CQYSMS",  # data written to CQY-COM-CCTV.dat file
+        "location": "CQY",
+        "system": "CCTS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CQY-COM-CCTV.dat to be written to this directory
+        "output": "CQY-COM-CCTV",
+    },
+    {
+        # CQY-COM-PAS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CQYSMS",  # data written to CQY-COM-PAS.dat file
+        "location": "CQY",
+        "system": "PASS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CQY-COM-PAS.dat to be written to this directory
+        "output": "CQY-COM-PAS",
+    },
+    {
+        # CQY-COM-PIS.dat file from OCCCMS database
+        "database": "CMS",  # xml_DB_CMS
+        "environ": "CQYSMS",  # data written to CQY-COM-PIS.dat file
+        "location": "CQY",
+        "system": "PISS_0001",  # search for BMF in the xml file
+        "output_dir": "occcms",  # CQY-COM-PIS.dat to be written to this directory
+        "output": "CQY-COM-PIS",
+    },
+]
+
+# Output profiles: SSR configurations of each set of SSR files and the timestamp format of their headers
+_profiles = {
+    "station": {"databases": databases, "timestamp_format": "%d/%m/%Y  %H:%M:%S"},
+    "occ": {"databases": occ_databases, "timestamp_format": "%d/%m/%Y %H:%M:%S"},
+}
+
 # A list of valid environments; used to validate --environment argument
 _environments = [
     "BGK",
@@ -3844,6 +4161,20 @@ _environments = [
     "ECS",
 ]
 
+# Stages of SSR generation timed for --report
+_stages = ["parse", "query", "parents", "sort", "write"]
+
+# Buffer size of SSR files being written; most SSR files are written with a single system call
+_write_buffer_size = 1024 * 1024
+
+# Estimated memory usage of a worker process for --max-memory (in MiB) before it loads a database, and
+# per MiB of instancesHierarchy.xml that it loads (measured with ElementTree, which takes the most memory)
+_worker_rss = 30
+_memory_factor = 12
+
+# Columns of --report
+_report_fields = ["profile", "output", "database", "location", "system", "status", "points"] + _stages + ["peak_rss"]
+
 
 def init_logger():
     """
@@ -3892,11 +4223,54 @@ def is_input_point(name):
     return False
 
 
-def write_ssr_file(db_points, environ, ssr_dat):
+def ssr_file_body(db_points, environ):
+    """
+    Returns lines of SSR file following its header
+    """
+    lines = [f"ENVIRONEMENT={environ}\n", "CONFIGURATION=\n"]
+    lines.extend(f"POINT=<alias>{point}\n" for point in db_points)
+    return lines
+
+
+def read_ssr_file_body(ssr_dat):
+    """
+    Returns lines of an existing SSR file following its header, or None when there is no such file
+    """
+    try:
+        with open(ssr_dat, "r") as infile:
+            lines = infile.readlines()
+    except FileNotFoundError:
+        return None
+    # The header, including its timestamp, consists of comment lines
+    return list(itertools.dropwhile(lambda line: line.startswith("#"), lines))
+
+
+def read_ssr_file_points(ssr_dat):
+    """
+    Returns points of an existing SSR file, or None when there is no such file
+    """
+    body = read_ssr_file_body(ssr_dat)
+    if body is None:
+        return None
+    prefix = "POINT=<alias>"
+    return [line.rstrip("\n")[len(prefix) :] for line in body if line.startswith(prefix)]
+
+
+def write_ssr_file(db_points, environ, ssr_dat, skip_unchanged=False, timestamp_format="%d/%m/%Y  %H:%M:%S"):
     """
     Write SSR file from given database points
+
+    When skip_unchanged is True, an existing SSR file is left untouched if only its header would change.
+    The SSR file is written to a temporary file first and renamed, so that it is never left half written.
+    Returns True when the SSR file is written.
     """
-    timestamp = datetime.now().strftime("%d/%m/%Y  %H:%M:%S")
+    body = ssr_file_body(db_points, environ)
+    if skip_unchanged and read_ssr_file_body(ssr_dat) == body:
+        logging.info(f"{len(db_points)} points unchanged in {ssr_dat}")
+        return False
+
+    # Header lines are of the same width whatever the timestamp format is
+    timestamp = datetime.now().strftime(timestamp_format).ljust(20)
     header = f"""###########################################################
 #  /home/dbs/SumReport/{environ}/{os.path.basename(ssr_dat)}                 #
 #  Status Summary Report configuration file               #
@@ -3904,82 +4278,1809 @@ def write_ssr_file(db_points, environ, ssr_dat):
 #                                                         #
 ###########################################################"""
 
-    with open(ssr_dat, "w") as outfile:
-        outfile.write(f"{header}\n")
-        outfile.write(f"ENVIRONEMENT={environ}\n")
-        outfile.write("CONFIGURATION=\n")
-
-        for point in db_points:
-            outfile.write(f"POINT=<alias>{point}\n")
+    temp_file = f"{ssr_dat}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "w", buffering=_write_buffer_size) as outfile:
+            outfile.write(f"{header}\n")
+            outfile.writelines(body)
+        os.replace(temp_file, ssr_dat)
+    except BaseException:
+        # A temporary file left behind would show up as an unversioned file in the output directory
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
 
     logging.info(f"{len(db_points)} points written to {ssr_dat}")
+    return True
 
 
-def do_work(xml_dir, dir_name, db):
+def timed_write_ssr_file(*args):
     """
-    Performs work to create a SSR file from database data
+    Write SSR file with write_ssr_file() and returns whether it is written with the time spent on it
     """
-    db_points = []
-
-    # temporary variables
-    database = db.get("database")  # xml_DB_XXX
-    location = db.get("location")  # BGK, BNK, ..., NDI, NPS, etc
-    system = db.get("system")  # BMF, CCTS_0001, ..., SIG, etc
+    start_write = time.perf_counter()
+    written = write_ssr_file(*args)
+    return written, time.perf_counter() - start_write
 
-    start_work = time.perf_counter()
-    logging.info(f"Processing {location}:{system} in {database} database ...")
 
-    xml_file = f"{xml_dir}/xml_DB_{database}/instancesHierarchy.xml"
-    logging.info(f"Parsing {xml_file} ...")
-    root = ET.parse(xml_file)
+def iterparse_hierarchy(xml_file):
+    """
+    Yields start and end events of a XML file like ET.iterparse()
 
-    results = root.findall(
-        f".//HierarchyItem[@name='{location}']//HierarchyItem[@name='{system}']//HierarchyItem"
-    )
-    for item in results:
-        alias = item.get("alias")
-        name = item.get("name")
+    Each element is cleared and detached from its parent after its end event,
+    so that only the current ancestor stack is kept in memory.
+    """
+    elements = []
+    with open_hierarchy(xml_file) as infile:
+        for event, elem in ET.iterparse(infile, events=("start", "end")):
+            if event == "start":
+                elements.append(elem)
+                yield event, elem
+            else:
+                yield event, elem
+                elements.pop()
+                elem.clear()
+                if elements:
+                    elements[-1].remove(elem)
 
-        if alias == f"{location}_{name}":
-            continue
-        if not is_input_point(name):
-            continue
 
-        parent = root.findall(f".//HierarchyItem[@alias='{alias}']/..")
-        if len(parent) != 1:
-            logging.warning(f"Unexpected number of parents ({len(parent)}) for {alias}")
-            continue
+def find_location_elements(root, locations):
+    """
+    Returns (element, number of elements in its subtree) of the outermost HierarchyItem elements under
+    a root element whose names are given locations, in document order
+    """
+    results = []
+    stack = [iter(root)]
+    while stack:
+        elem = next(stack[-1], None)
+        if elem is None:
+            stack.pop()
+        elif elem.tag == "HierarchyItem" and elem.get("name") in locations:
+            results.append((elem, sum(1 for _ in elem.iter())))
+        else:
+            stack.append(iter(elem))
+    return results
 
-        prefix = parent[0].get("alias")
-        point = f"{prefix}:{name}"
-        db_points.append(point)
 
-    if len(db_points) > 0:
-        db_points.sort(key=cmp_to_key(locale.strcoll))
-        output_dir = f"{dir_name}/{db.get('output_dir')}"
-        if not is_valid_dir(output_dir):
-            try:
-                logging.info(f"Creating directory: {output_dir}")
-                os.mkdir(output_dir)
-            except OSError:
-                logging.error(f"Creation of the directory {output_dir} failed")
-        ssr_dat = f"{output_dir}/{db.get('output')}.dat"
-        environ = db.get("environ")
-        write_ssr_file(db_points, environ, ssr_dat)
+def walk_elements(root, subtrees=None):
+    """
+    Yields (depth, is_item, alias, name) of a root element and the elements of given subtrees
+    (all children of the root element when subtrees is None) in document order
 
-    end_work = time.perf_counter()
-    logging.info(
-        f"Processing {location}:{system} in {database} database ... DONE ({end_work - start_work:0.4f}s)"
-    )
+    Given subtrees are walked as if they were children of the root element.
+    """
+    yield 0, root.tag == "HierarchyItem", root.get("alias"), root.get("name")
+    children = iter(root) if subtrees is None else iter(subtrees)
+    stack = [children]
+    while stack:
+        elem = next(stack[-1], None)
+        if elem is None:
+            stack.pop()
+            continue
+        yield len(stack), elem.tag == "HierarchyItem", elem.get("alias"), elem.get("name")
+        stack.append(iter(elem))
 
 
-def main():
+class HierarchyIndex:
     """
-    main function
+    Index of a parsed instancesHierarchy.xml file
+
+    Maps every element to its parent and every alias to its HierarchyItem elements once,
+    so that finding the parent of an input point no longer scans the whole tree.
     """
-    init_logger()
 
-    parser = argparse.ArgumentParser(prog="generate-ssr4")
+    def __init__(self, tree):
+        self.root = tree.getroot()
+        self.parent_of = {}
+        self.items_by_alias = {}
+
+        for parent in self.root.iter():
+            for child in parent:
+                self.parent_of[child] = parent
+                if child.tag == "HierarchyItem":
+                    self.items_by_alias.setdefault(child.get("alias"), []).append(child)
+
+    def find_items(self, location, system):
+        """
+        Returns (alias, name) of all HierarchyItem elements under a given system of a given location
+        """
+        results = self.root.findall(
+            f".//HierarchyItem[@name='{location}']//HierarchyItem[@name='{system}']//HierarchyItem"
+        )
+        return [(item.get("alias"), item.get("name")) for item in results]
+
+    def find_parents(self, alias):
+        """
+        Returns aliases of the parents of HierarchyItem elements with a given alias
+        (same as findall(".//HierarchyItem[@alias='{alias}']/.."))
+        """
+        parents = []
+        for item in self.items_by_alias.get(alias, []):
+            parent = self.parent_of[item]
+            if parent not in parents:
+                parents.append(parent)
+        return [parent.get("alias") for parent in parents]
+
+    def location_subtrees(self, locations):
+        """
+        Returns (element, size) of the outermost HierarchyItem elements named after given locations
+        """
+        return find_location_elements(self.root, locations)
+
+    def walk(self, subtrees=None):
+        """
+        Yields (depth, is_item, alias, name) of every element in document order
+
+        When subtrees (elements returned by location_subtrees()) is given, only the root element and
+        the given subtrees are walked, as if they were children of the root element.
+        """
+        return walk_elements(self.root, subtrees)
+
+
+class LxmlHierarchyIndex:
+    """
+    Index of an instancesHierarchy.xml file parsed by lxml
+
+    lxml elements know their parents, so no parent map is needed. Locations are looked up by name and
+    systems are found under each location by a compiled XPath expression, one location and one system
+    at a time, so that items under nested locations or systems are found as many times as ElementTree
+    finds them (XPath removes duplicates).
+    """
+
+    def __init__(self, tree):
+        self.root = tree.getroot()
+        self.items_by_name = {}
+        self.items_by_alias = {}
+        self.find_by_name = lxml_etree.XPath("descendant::HierarchyItem[@name = $name]")
+
+        for item in self.root.iterdescendants("HierarchyItem"):
+            self.items_by_name.setdefault(item.get("name"), []).append(item)
+            self.items_by_alias.setdefault(item.get("alias"), []).append(item)
+
+    def find_items(self, location, system):
+        """
+        Returns (alias, name) of all HierarchyItem elements under a given system of a given location
+        """
+        results = []
+        for location_item in self.items_by_name.get(location, []):
+            for system_item in self.find_by_name(location_item, name=system):
+                results.extend(
+                    (item.get("alias"), item.get("name")) for item in system_item.iterdescendants("HierarchyItem")
+                )
+        return results
+
+    def find_parents(self, alias):
+        """
+        Returns aliases of the parents of HierarchyItem elements with a given alias
+        """
+        parents = []
+        for item in self.items_by_alias.get(alias, []):
+            parent = item.getparent()
+            if parent not in parents:
+                parents.append(parent)
+        return [parent.get("alias") for parent in parents]
+
+    def location_subtrees(self, locations):
+        """
+        Returns (element, size) of the outermost HierarchyItem elements named after given locations
+        """
+        return find_location_elements(self.root, locations)
+
+    def walk(self, subtrees=None):
+        """
+        Yields (depth, is_item, alias, name) of every element in document order
+
+        When subtrees (elements returned by location_subtrees()) is given, only the root element and
+        the given subtrees are walked, as if they were children of the root element.
+        """
+        return walk_elements(self.root, subtrees)
+
+
+def outermost_subtrees(elements, ends):
+    """
+    Returns (index, size) of the elements (indexes in document order) that are not descendants of another
+    of the elements, where the descendants of element i are elements i + 1 to ends[i] - 1
+    """
+    results = []
+    end = 0
+    for i in elements:
+        if i >= end:
+            end = ends[i]
+            results.append((i, end - i))
+    return results
+
+
+class CompactHierarchy:
+    """
+    Compact form of instancesHierarchy.xml file that can be cached on disk
+
+    Elements are stored in document order as parallel lists. Descendants of element i are
+    elements i + 1 to ends[i] - 1, which answers location and system membership without a tree.
+    """
+
+    def __init__(self):
+        self.items = []  # True when an element is HierarchyItem
+        self.names = []
+        self.aliases = []
+        self.parents = []  # index of the parent element (-1 for the root element)
+        self.ends = []  # index following the last descendant element
+        self.items_by_name = {}
+        self.items_by_alias = {}
+
+    @classmethod
+    def from_file(cls, xml_file):
+        """
+        Builds CompactHierarchy from a XML file
+        """
+        hierarchy = cls()
+        ancestors = []
+        for event, elem in iterparse_hierarchy(xml_file):
+            if event == "end":
+                hierarchy.ends[ancestors.pop()] = len(hierarchy.names)
+                continue
+
+            i = len(hierarchy.names)
+            is_item = elem.tag == "HierarchyItem"
+            name = elem.get("name")
+            alias = elem.get("alias")
+
+            hierarchy.items.append(is_item)
+            hierarchy.names.append(name)
+            hierarchy.aliases.append(alias)
+            hierarchy.parents.append(ancestors[-1] if ancestors else -1)
+            hierarchy.ends.append(i + 1)
+            # The root element is never matched by .//HierarchyItem
+            if ancestors and is_item:
+                hierarchy.items_by_name.setdefault(name, []).append(i)
+                hierarchy.items_by_alias.setdefault(alias, []).append(i)
+            ancestors.append(i)
+        return hierarchy
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restores CompactHierarchy from its attributes
+        """
+        hierarchy = cls()
+        hierarchy.__dict__.update(state)
+        return hierarchy
+
+    def find_items(self, location, system):
+        """
+        Returns (alias, name) of all HierarchyItem elements under a given system of a given location
+        """
+        results = []
+        systems = self.items_by_name.get(system, [])
+        for i in self.items_by_name.get(location, []):
+            start = bisect.bisect_right(systems, i)
+            stop = bisect.bisect_left(systems, self.ends[i])
+            for j in systems[start:stop]:
+                results.extend(
+                    (self.aliases[k], self.names[k]) for k in range(j + 1, self.ends[j]) if self.items[k]
+                )
+        return results
+
+    def find_parents(self, alias):
+        """
+        Returns aliases of the parents of HierarchyItem elements with a given alias
+        """
+        parents = []
+        for i in self.items_by_alias.get(alias, []):
+            parent = self.parents[i]
+            if parent not in parents:
+                parents.append(parent)
+        return [self.aliases[parent] for parent in parents]
+
+    def location_subtrees(self, locations):
+        """
+        Returns (index, size) of the outermost HierarchyItem elements named after given locations
+        """
+        elements = sorted(i for location in locations for i in self.items_by_name.get(location, []))
+        return outermost_subtrees(elements, self.ends)
+
+    def walk(self, subtrees=None):
+        """
+        Yields (depth, is_item, alias, name) of every element in document order
+
+        When subtrees (indexes returned by location_subtrees()) is given, only the root element and
+        the given subtrees are walked, as if they were children of the root element.
+        """
+        if subtrees is None:
+            ranges = [range(len(self.names))]
+        else:
+            ranges = [range(1)] + [range(i, self.ends[i]) for i in subtrees]
+        open_ends = []
+        for i in itertools.chain.from_iterable(ranges):
+            while open_ends and open_ends[-1] <= i:
+                open_ends.pop()
+            yield len(open_ends), self.items[i], self.aliases[i], self.names[i]
+            open_ends.append(self.ends[i])
+
+
+class ArrayHierarchy:
+    """
+    Compact form of instancesHierarchy.xml file built with expat callbacks, without ElementTree elements
+
+    Elements are stored in document order as parallel arrays of the array module: the parent, the depth,
+    the index following the last descendant, and the ids of the tag, name and alias in a table of interned
+    strings (id 0 stands for a missing attribute). Each element takes a few dozen bytes instead of an Element
+    with its attribute dict, and walking the database reads the arrays in order.
+
+    HierarchyItem elements (except the root element) with each name or alias are listed in document order
+    in one array: elements with name id k are by_name[name_starts[k]:name_starts[k + 1]].
+    """
+
+    def __init__(self):
+        self.strings = [None]
+        self.ids = {None: 0}
+        self.tags = array.array("i")
+        self.names = array.array("i")
+        self.aliases = array.array("i")
+        self.parents = array.array("i")  # index of the parent element (-1 for the root element)
+        self.depths = array.array("i")
+        self.ends = array.array("i")  # index following the last descendant element
+        self.item_tag = -1
+        self.name_starts, self.by_name = array.array("i"), array.array("i")
+        self.alias_starts, self.by_alias = array.array("i"), array.array("i")
+
+    @classmethod
+    def from_file(cls, xml_file):
+        """
+        Builds ArrayHierarchy from a XML file
+        """
+        hierarchy = cls()
+        strings, ids = hierarchy.strings, hierarchy.ids
+        tags, names, aliases = hierarchy.tags, hierarchy.names, hierarchy.aliases
+        parents, depths, ends = hierarchy.parents, hierarchy.depths, hierarchy.ends
+        ancestors = []
+
+        def intern_id(value):
+            string_id = ids.get(value)
+            if string_id is None:
+                string_id = ids[value] = len(strings)
+                strings.append(value)
+            return string_id
+
+        def start_element(tag, attrs):
+            i = len(tags)
+            tags.append(intern_id(tag))
+            names.append(intern_id(attrs.get("name")))
+            aliases.append(intern_id(attrs.get("alias")))
+            parents.append(ancestors[-1] if ancestors else -1)
+            depths.append(len(ancestors))
+            ends.append(i + 1)
+            ancestors.append(i)
+
+        def end_element(tag):
+            ends[ancestors.pop()] = len(tags)
+
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        with open_hierarchy(xml_file) as infile:
+            parser.ParseFile(infile)
+
+        hierarchy.item_tag = ids.get("HierarchyItem", -1)
+        hierarchy.name_starts, hierarchy.by_name = hierarchy.group_items(names)
+        hierarchy.alias_starts, hierarchy.by_alias = hierarchy.group_items(aliases)
+        return hierarchy
+
+    def group_items(self, string_ids):
+        """
+        Returns (starts, items): HierarchyItem elements (except the root element) grouped by given string ids
+        in document order, where elements with id k are items[starts[k]:starts[k + 1]]
+        """
+        starts = array.array("i", [0]) * (len(self.strings) + 1)
+        for i in range(1, len(self.tags)):
+            if self.tags[i] == self.item_tag:
+                starts[string_ids[i] + 1] += 1
+        for k in range(1, len(starts)):
+            starts[k] += starts[k - 1]
+
+        items = array.array("i", [0]) * starts[-1]
+        positions = starts[:-1]
+        for i in range(1, len(self.tags)):
+            if self.tags[i] == self.item_tag:
+                items[positions[string_ids[i]]] = i
+                positions[string_ids[i]] += 1
+        return starts, items
+
+    def find_items(self, location, system):
+        """
+        Returns (alias, name) of all HierarchyItem elements under a given system of a given location
+        """
+        results = []
+        location_id = self.ids.get(location)
+        system_id = self.ids.get(system)
+        if location_id is None or system_id is None:
+            return results
+
+        systems_start, systems_end = self.name_starts[system_id], self.name_starts[system_id + 1]
+        for i in self.by_name[self.name_starts[location_id] : self.name_starts[location_id + 1]]:
+            start = bisect.bisect_right(self.by_name, i, systems_start, systems_end)
+            stop = bisect.bisect_left(self.by_name, self.ends[i], start, systems_end)
+            for j in self.by_name[start:stop]:
+                results.extend(
+                    (self.strings[self.aliases[k]], self.strings[self.names[k]])
+                    for k in range(j + 1, self.ends[j])
+                    if self.tags[k] == self.item_tag
+                )
+        return results
+
+    def find_parents(self, alias):
+        """
+        Returns aliases of the parents of HierarchyItem elements with a given alias
+        """
+        alias_id = self.ids.get(alias)
+        if alias_id is None:
+            return []
+
+        parents = []
+        for i in self.by_alias[self.alias_starts[alias_id] : self.alias_starts[alias_id + 1]]:
+            parent = self.parents[i]
+            if parent not in parents:
+                parents.append(parent)
+        return [self.strings[self.aliases[parent]] for parent in parents]
+
+    def location_subtrees(self, locations):
+        """
+        Returns (index, size) of the outermost HierarchyItem elements named after given locations
+        """
+        elements = []
+        for location in locations:
+            name_id = self.ids.get(location)
+            if name_id is not None:
+                elements.extend(self.by_name[self.name_starts[name_id] : self.name_starts[name_id + 1]])
+        return outermost_subtrees(sorted(elements), self.ends)
+
+    def walk(self, subtrees=None):
+        """
+        Yields (depth, is_item, alias, name) of every element in document order
+
+        When subtrees (indexes returned by location_subtrees()) is given, only the root element and
+        the given subtrees are walked, as if they were children of the root element.
+        """
+        if subtrees is None:
+            walks = [(range(len(self.tags)), 0)]
+        else:
+            # Depths are shifted, so that each subtree starts at depth 1
+            walks = [(range(1), 0)] + [(range(i, self.ends[i]), self.depths[i] - 1) for i in subtrees]
+        strings = self.strings
+        for elements, shift in walks:
+            for i in elements:
+                yield (
+                    self.depths[i] - shift,
+                    self.tags[i] == self.item_tag,
+                    strings[self.aliases[i]],
+                    strings[self.names[i]],
+                )
+
+
+def file_digest(file_name):
+    """
+    Returns SHA-256 digest of a given file (or a member of a database zip file)
+    """
+    digest = hashlib.sha256()
+    with open_hierarchy(file_name) as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_hierarchy_cache(cache_file, key, hierarchy):
+    """
+    Write CompactHierarchy with its cache key to a cache file
+    """
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, "wb") as outfile:
+        pickle.dump(key, outfile, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(vars(hierarchy), outfile, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+    logging.info(f"Cached {key['size']} bytes of XML in {cache_file}")
+
+
+def load_cached_hierarchy(xml_file, cache_file):
+    """
+    Returns CompactHierarchy of a given XML file from a cache file, rebuilding the cache when stale
+
+    The cache is keyed by size, mtime and content hash of the XML file. When only mtime differs
+    (e.g., the same database is uncompressed again), the content hash decides.
+    """
+    size, mtime = hierarchy_stat(xml_file)
+    key = {"size": size, "mtime": mtime, "sha256": None}
+
+    try:
+        with open(cache_file, "rb") as infile:
+            cached_key = pickle.load(infile)
+            if cached_key["size"] == key["size"]:
+                if cached_key["mtime"] == key["mtime"]:
+                    logging.info(f"Loading {xml_file} from {cache_file} ...")
+                    return CompactHierarchy.from_state(pickle.load(infile))
+
+                key["sha256"] = file_digest(xml_file)
+                if cached_key["sha256"] == key["sha256"]:
+                    logging.info(f"Loading {xml_file} from {cache_file} ...")
+                    hierarchy = CompactHierarchy.from_state(pickle.load(infile))
+                    save_hierarchy_cache(cache_file, key, hierarchy)
+                    return hierarchy
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError) as e:
+        logging.warning(f"Ignoring unreadable cache {cache_file}: {e}")
+
+    logging.info(f"Parsing {xml_file} ...")
+    hierarchy = CompactHierarchy.from_file(xml_file)
+    if key["sha256"] is None:
+        key["sha256"] = file_digest(xml_file)
+    save_hierarchy_cache(cache_file, key, hierarchy)
+    return hierarchy
+
+
+def is_database_zip(xml_dir):
+    """
+    Returns True when xml_dir is a compressed database file (e.g., NELDB_MOCC_P22_P22.zip)
+    """
+    return os.path.isfile(xml_dir) and zipfile.is_zipfile(xml_dir)
+
+
+@lru_cache(maxsize=None)
+def zip_hierarchy_members(zip_file):
+    """
+    Returns names of instancesHierarchy.xml members of a database zip file by their database
+
+    Members are found wherever the database directory is in the zip file
+    (e.g., NELDB_MOCC_P22_P22/Database/xml_DB_CMS/instancesHierarchy.xml).
+    """
+    members = {}
+    with zipfile.ZipFile(zip_file) as infile:
+        for name in infile.namelist():
+            parts = name.split("/")
+            if len(parts) >= 2 and parts[-1] == "instancesHierarchy.xml" and parts[-2].startswith("xml_DB_"):
+                members.setdefault(parts[-2][len("xml_DB_") :], name)
+    return members
+
+
+def hierarchy_file(xml_dir, database):
+    """
+    Returns a path to instancesHierarchy.xml file of a given database
+
+    When xml_dir is a database zip file, the path is the zip file and its member separated by "::".
+    """
+    if is_database_zip(xml_dir):
+        member = zip_hierarchy_members(xml_dir).get(database, f"xml_DB_{database}/instancesHierarchy.xml")
+        return f"{xml_dir}::{member}"
+    return f"{xml_dir}/xml_DB_{database}/instancesHierarchy.xml"
+
+
+@contextmanager
+def open_hierarchy(xml_file):
+    """
+    Opens instancesHierarchy.xml file returned by hierarchy_file() for reading in binary mode
+
+    A member of a database zip file is decompressed as it is read, through a zip file handle of its own,
+    so that worker processes never share one.
+    """
+    zip_file, separator, member = xml_file.partition("::")
+    if separator == "":
+        with open(xml_file, "rb") as infile:
+            yield infile
+        return
+
+    with zipfile.ZipFile(zip_file) as archive, archive.open(member) as infile:
+        yield infile
+
+
+def hierarchy_stat(xml_file):
+    """
+    Returns size and mtime (in nanoseconds) of instancesHierarchy.xml file returned by hierarchy_file()
+
+    Raises OSError when there is no such file.
+    """
+    zip_file, separator, member = xml_file.partition("::")
+    if separator == "":
+        stat = os.stat(xml_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    with zipfile.ZipFile(zip_file) as archive:
+        try:
+            info = archive.getinfo(member)
+        except KeyError:
+            raise FileNotFoundError(f"{xml_file} is not found") from None
+    mtime = datetime(*info.date_time).timestamp()
+    return info.file_size, int(mtime) * 1000000000
+
+
+# Hierarchies loaded by the main process before the pool is created (see preload_hierarchies())
+_preloaded_hierarchies = {}
+
+
+def hierarchy_exists(xml_file):
+    """
+    Returns True when instancesHierarchy.xml file returned by hierarchy_file() exists
+    """
+    try:
+        hierarchy_stat(xml_file)
+    except OSError:
+        return False
+    return True
+
+
+def load_hierarchy(xml_dir, database, cache_dir=None, backend="etree"):
+    """
+    Parse instancesHierarchy.xml file of a given database and index it
+
+    When cache_dir is given, the compact form of the database is loaded from (or saved to) the cache.
+    Otherwise, the database is parsed by a given XML backend ("etree", "lxml" or "expat").
+    """
+    if database in _preloaded_hierarchies:
+        return _preloaded_hierarchies[database]
+
+    xml_file = hierarchy_file(xml_dir, database)
+    if cache_dir:
+        return load_cached_hierarchy(xml_file, f"{cache_dir}/xml_DB_{database}.cache")
+
+    logging.info(f"Parsing {xml_file} ...")
+    if backend == "expat":
+        return ArrayHierarchy.from_file(xml_file)
+    with open_hierarchy(xml_file) as infile:
+        if backend == "lxml":
+            return LxmlHierarchyIndex(lxml_etree.parse(infile))
+        return HierarchyIndex(ET.parse(infile))
+
+
+def resolve_backend(backend):
+    """
+    Returns the XML backend to be used for a given --xml-backend argument, or None when it is not available
+    """
+    if backend == "auto":
+        return "etree" if lxml_etree is None else "lxml"
+    if backend == "lxml" and lxml_etree is None:
+        return None
+    return backend
+
+
+def extract_points(index, db, timings=None):
+    """
+    Returns a list of input points for a given SSR configuration from an indexed database
+
+    When timings is given, time spent on querying items and resolving parents is added to it.
+    """
+    if timings is None:
+        timings = new_timings()
+    db_points = []
+
+    location = db.get("location")  # BGK, BNK, ..., NDI, NPS, etc
+    system = db.get("system")  # BMF, CCTS_0001, ..., SIG, etc
+
+    start_query = time.perf_counter()
+    results = index.find_items(location, system)
+    timings["query"] += time.perf_counter() - start_query
+
+    for alias, name in results:
+        if alias == f"{location}_{name}":
+            continue
+        if not is_input_point(name):
+            continue
+
+        start_parents = time.perf_counter()
+        parent = index.find_parents(alias)
+        timings["parents"] += time.perf_counter() - start_parents
+        if len(parent) != 1:
+            logging.warning(f"Unexpected number of parents ({len(parent)}) for {alias}")
+            continue
+
+        prefix = parent[0]
+        point = f"{prefix}:{name}"
+        db_points.append(point)
+
+    return db_points
+
+
+class SystemMatcher:
+    """
+    Tracks location and system ancestors of the current element for given SSR configurations
+
+    matches maps each SSR configuration (its index in db_list) to the number of location and system
+    ancestor pairs of the current element. An element is found that many times by
+    .//HierarchyItem[@name=location]//HierarchyItem[@name=system]//HierarchyItem, which does not
+    remove duplicates when locations or systems are nested.
+    """
+
+    def __init__(self, db_list):
+        self.db_list = db_list
+        self.locations = {}
+        self.systems = {}
+        for i, db in enumerate(db_list):
+            self.locations.setdefault(db.get("location"), []).append(i)
+            self.systems.setdefault(db.get("system"), []).append(i)
+        self.location_count = {}  # number of location ancestors for each SSR configuration
+        self.matches = {}
+        self.undo_stack = []
+
+    @property
+    def depth(self):
+        return len(self.undo_stack)
+
+    def enter(self, name):
+        """
+        Makes an element the ancestor of the following elements until leave() is called
+
+        name is None for elements that are never matched (the root element and non-HierarchyItem elements).
+        """
+        undo = []
+        if name is not None:
+            for i in self.systems.get(name, []):
+                if i in self.location_count:
+                    count = self.location_count[i]
+                    self.matches[i] = self.matches.get(i, 0) + count
+                    undo.append((self.matches, i, count))
+            for i in self.locations.get(name, []):
+                self.location_count[i] = self.location_count.get(i, 0) + 1
+                undo.append((self.location_count, i, 1))
+        self.undo_stack.append(undo)
+
+    def leave(self):
+        """
+        Removes the last entered element from the ancestors
+        """
+        for counter, i, count in self.undo_stack.pop():
+            counter[i] -= count
+            if counter[i] == 0:
+                del counter[i]
+
+    def match_point(self, alias, name):
+        """
+        Returns (index, count) of SSR configurations that a HierarchyItem belongs to as an input point
+        """
+        if not self.matches or not is_input_point(name):
+            return []
+        return [
+            (i, count) for i, count in self.matches.items() if alias != f"{self.db_list[i].get('location')}_{name}"
+        ]
+
+
+def stream_points(xml_file, db_list, timings=None):
+    """
+    Returns a list of input points for each of given SSR configurations by streaming a database file
+
+    The first pass tracks location and system ancestors of every HierarchyItem and keeps the candidate
+    input points under the requested location and system pairs. The second pass finds the parents of
+    the candidate aliases, which may appear anywhere in the file.
+
+    When timings is given, time spent on the first pass is added to it as parse time (parsing and
+    querying are done together) and time spent on the second pass as parent resolution time.
+    """
+    if timings is None:
+        timings = new_timings()
+    start_parse = time.perf_counter()
+    candidates = [[] for _ in db_list]
+    matcher = SystemMatcher(db_list)
+
+    logging.info(f"Streaming {xml_file} ...")
+    for event, elem in iterparse_hierarchy(xml_file):
+        if event == "end":
+            matcher.leave()
+            continue
+
+        # The root element is never matched by .//HierarchyItem
+        if matcher.depth and elem.tag == "HierarchyItem":
+            alias = elem.get("alias")
+            name = elem.get("name")
+            for i, count in matcher.match_point(alias, name):
+                candidates[i].extend([(alias, name)] * count)
+            matcher.enter(name)
+        else:
+            matcher.enter(None)
+
+    start_parents = time.perf_counter()
+    timings["parse"] += start_parents - start_parse
+
+    parents = {alias: {} for points in candidates for alias, _ in points}
+    ancestors = []
+    for seq, (event, elem) in enumerate(iterparse_hierarchy(xml_file)):
+        if event == "end":
+            ancestors.pop()
+            continue
+
+        alias = elem.get("alias")
+        if ancestors and elem.tag == "HierarchyItem" and alias in parents:
+            parent_seq, parent_alias = ancestors[-1]
+            parents[alias].setdefault(parent_seq, parent_alias)
+        ancestors.append((seq, alias))
+
+    all_points = []
+    for points in candidates:
+        db_points = []
+        for alias, name in points:
+            parent = list(parents[alias].values())
+            if len(parent) != 1:
+                logging.warning(f"Unexpected number of parents ({len(parent)}) for {alias}")
+                continue
+
+            prefix = parent[0]
+            point = f"{prefix}:{name}"
+            db_points.append(point)
+        all_points.append(db_points)
+
+    timings["parents"] += time.perf_counter() - start_parents
+    return all_points
+
+
+def route_points(index, db_list, timings=None, subtrees=None):
+    """
+    Returns a list of input points for each of given SSR configurations from an indexed database
+
+    Instead of querying the database once per SSR configuration, walks the database once while
+    tracking location and system ancestors, and adds every input point to all SSR configurations
+    it belongs to. When subtrees (returned by location_subtrees() of the index) is given, only input
+    points in those subtrees are returned; parents are still found in the whole database.
+
+    When timings is given, time spent on the walk is added to it as query time and time spent on
+    resolving parents as parent resolution time.
+    """
+    if timings is None:
+        timings = new_timings()
+    all_points = [[] for _ in db_list]
+    parents = {}  # parents of the input points found so far
+    parents_time = 0
+    matcher = SystemMatcher(db_list)
+
+    start_query = time.perf_counter()
+    for depth, is_item, alias, name in index.walk(subtrees):
+        while matcher.depth > depth:
+            matcher.leave()
+
+        # The root element is never matched by .//HierarchyItem
+        if not depth or not is_item:
+            matcher.enter(None)
+            continue
+
+        for i, count in matcher.match_point(alias, name):
+            if alias not in parents:
+                start_parents = time.perf_counter()
+                parents[alias] = index.find_parents(alias)
+                parents_time += time.perf_counter() - start_parents
+
+            parent = parents[alias]
+            for _ in range(count):
+                if len(parent) != 1:
+                    logging.warning(f"Unexpected number of parents ({len(parent)}) for {alias}")
+                    continue
+                all_points[i].append(f"{parent[0]}:{name}")
+        matcher.enter(name)
+
+    timings["query"] += time.perf_counter() - start_query - parents_time
+    timings["parents"] += parents_time
+    return all_points
+
+
+def collect_points(xml_dir, database, db_list, engine="tree", cache_dir=None, backend="etree"):
+    """
+    Yields each of given SSR configurations of a database with its input points and timings
+
+    - "tree" engine parses the database into an indexed ElementTree and queries it per SSR configuration
+    - "stream" engine streams the database with iterparse and collects all SSR configurations at once
+    - "walk" engine loads the database like "tree" engine and walks it once for all SSR configurations
+
+    Time spent on work shared by all SSR configurations (e.g., parsing) is only included in
+    the timings of the first SSR configuration. cache_dir and backend are not used by "stream" engine.
+    """
+    timings = new_timings()
+    if engine == "stream":
+        all_points = stream_points(hierarchy_file(xml_dir, database), db_list, timings)
+        for db, db_points in zip(db_list, all_points):
+            yield db, db_points, timings
+            timings = new_timings()
+        return
+
+    start_parse = time.perf_counter()
+    index = load_hierarchy(xml_dir, database, cache_dir, backend)
+    timings["parse"] += time.perf_counter() - start_parse
+    if engine == "walk":
+        all_points = route_points(index, db_list, timings)
+        for db, db_points in zip(db_list, all_points):
+            yield db, db_points, timings
+            timings = new_timings()
+        return
+
+    for db in db_list:
+        db_points = extract_points(index, db, timings)
+        yield db, db_points, timings
+        timings = new_timings()
+
+
+def preload_hierarchies(xml_dir, database_names, cache_dir=None, backend="etree"):
+    """
+    Load hierarchies of given databases in the main process before the pool is created
+
+    Forked workers share the preloaded hierarchies through copy-on-write memory instead of loading them again.
+    Returns False when workers are not forked (e.g., spawn start method under macOS and Windows);
+    each worker then loads hierarchies by itself.
+    """
+    start_method = multiprocessing.get_start_method()
+    if start_method != "fork":
+        logging.info(f"Not preloading databases as workers are started by {start_method}")
+        return False
+
+    for database in database_names:
+        _preloaded_hierarchies[database] = load_hierarchy(xml_dir, database, cache_dir, backend)
+    # Keep garbage collector from touching (and thus copying) the preloaded objects in workers
+    gc.freeze()
+    return True
+
+
+def split_subtrees(sizes, parts):
+    """
+    Returns positions of location subtrees (of given sizes) assigned to each of given number of parts
+
+    Input points are only found under locations, and every location and system ancestor of an input
+    point is in the same outermost location subtree as the point, so each part finds its input points
+    by itself. The largest subtrees are assigned first, each to the part with the fewest elements so far
+    (the first such part), so that the same database is always split the same way.
+    """
+    loads = [0] * parts
+    assignments = [set() for _ in range(parts)]
+    for k in sorted(range(len(sizes)), key=lambda k: (-sizes[k], k)):
+        part = min(range(parts), key=lambda part: (loads[part], part))
+        assignments[part].add(k)
+        loads[part] += sizes[k]
+    return assignments
+
+
+@lru_cache(maxsize=1024 * 1024)
+def collation_key(point):
+    """
+    Returns locale.strxfrm() of a given point
+
+    Keys are cached, so that points sorted again in the same process are transformed only once.
+    """
+    return locale.strxfrm(point)
+
+
+def sort_points(db_points):
+    """
+    Sort database points in the same order as sort(key=cmp_to_key(locale.strcoll))
+
+    Comparing locale.strxfrm() keys gives the same order as comparing with locale.strcoll(),
+    but without calling a Python comparison function O(n log n) times. In C and POSIX locales,
+    strxfrm() leaves strings as they are, so points are sorted without keys.
+    """
+    if locale.setlocale(locale.LC_COLLATE) in ["C", "POSIX"]:
+        db_points.sort()
+    else:
+        db_points.sort(key=collation_key)
+
+
+def new_timings():
+    """
+    Returns timings of the stages of SSR generation, all zero
+    """
+    return dict.fromkeys(_stages, 0.0)
+
+
+def reset_peak_rss():
+    """
+    Resets peak resident set size of the current process to its current resident set size
+
+    Only Linux can reset it (through /proc/self/clear_refs). Returns False when it is not reset;
+    peak_rss() then returns the peak of the whole life of the process.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+
+    # Memory freed by the previous job is returned to the system first, so that it is not counted again
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):  # not glibc
+        pass
+    try:
+        with open("/proc/self/clear_refs", "w") as outfile:
+            outfile.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Returns peak resident set size of the current process in MiB (since reset_peak_rss() under Linux),
+    or None when it is not available
+    """
+    try:
+        with open("/proc/self/status") as infile:
+            for line in infile:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes under macOS and in kilobytes under Linux
+    if sys.platform == "darwin":
+        return max_rss / (1024 * 1024)
+    return max_rss / 1024
+
+
+def output_ssr_file(db_points, dir_name, db, skip_unchanged=False, timings=None, writer=None):
+    """
+    Sort given database points and write them to the SSR file of a given SSR configuration
+
+    Returns a manifest record of the SSR file. Its "status" is "written", "unchanged" (skipped because
+    only the header would change), "deleted" (no points, so the existing SSR file is removed) or "empty"
+    (no points and no SSR file).
+    When timings is given, time spent on sorting and writing is added to it.
+
+    When writer (an executor) is given, the SSR file is written by the writer and the record is
+    completed by wait_for_writes() instead.
+    """
+    if timings is None:
+        timings = new_timings()
+    status = "empty"
+    if len(db_points) > 0:
+        start_sort = time.perf_counter()
+        sort_points(db_points)
+        start_write = time.perf_counter()
+        timings["sort"] += start_write - start_sort
+        output_dir = f"{dir_name}/{db.get('output_dir')}"
+        if not is_valid_dir(output_dir):
+            try:
+                logging.info(f"Creating directory: {output_dir}")
+                os.mkdir(output_dir)
+            except OSError:
+                logging.error(f"Creation of the directory {output_dir} failed")
+        ssr_dat = f"{output_dir}/{db.get('output')}.dat"
+        environ = db.get("environ")
+        timestamp_format = _profiles[db.get("profile", "station")]["timestamp_format"]
+        write_args = [db_points, environ, ssr_dat, skip_unchanged, timestamp_format]
+        if writer is not None:
+            status = writer.submit(timed_write_ssr_file, *write_args)
+        elif write_ssr_file(*write_args):
+            status = "written"
+        else:
+            status = "unchanged"
+        timings["write"] += time.perf_counter() - start_write
+    elif os.path.isfile(f"{dir_name}/{ssr_output_name(db)}"):
+        # A SSR file left from a previous run would keep the points that are gone
+        os.remove(f"{dir_name}/{ssr_output_name(db)}")
+        logging.info(f"No points left in {dir_name}/{ssr_output_name(db)}; removed")
+        status = "deleted"
+
+    return {
+        "profile": db.get("profile", "station"),
+        "output": ssr_output_name(db),
+        "status": status,
+        "points": len(db_points),
+        "points_sha256": points_digest(db_points),
+    }
+
+
+def compare_ssr_file(db_points, dir_name, db, timings=None):
+    """
+    Compare given database points with the existing SSR file of a given SSR configuration
+
+    Returns a record of the SSR file like output_ssr_file() without writing it, with the sorted points
+    to be "added" to and "removed" from the existing SSR file. Its "status" is "new", "changed",
+    "same", "deleted" (no points, but the SSR file exists) or "empty" (no points and no SSR file).
+    When timings is given, time spent on comparing is added to it as write time.
+    """
+    if timings is None:
+        timings = new_timings()
+    start_write = time.perf_counter()
+    existing = read_ssr_file_points(f"{dir_name}/{ssr_output_name(db)}")
+    points = set(db_points)
+    added = list(points.difference(existing or []))
+    removed = list(set(existing or []).difference(points))
+    sort_points(added)
+    sort_points(removed)
+
+    if existing is None:
+        status = "new" if len(points) > 0 else "empty"
+    elif len(points) == 0:
+        status = "deleted"
+    else:
+        # Points found more than once are not told apart by set operations, but by the number of points
+        status = "changed" if added or removed or len(existing) != len(db_points) else "same"
+    timings["write"] += time.perf_counter() - start_write
+
+    return {
+        "profile": db.get("profile", "station"),
+        "output": ssr_output_name(db),
+        "status": status,
+        "points": len(db_points),
+        "points_sha256": points_digest(db_points),
+        "added": added,
+        "removed": removed,
+    }
+
+
+def unconfigured_ssr_files(dir_name, db_list):
+    """
+    Returns SSR files found in the directories of given SSR configurations that none of them generates
+
+    Each directory only has SSR files of a single database, so SSR files of other databases are not
+    reported when only some databases are processed.
+    """
+    outputs = {ssr_output_name(db) for db in db_list}
+    ssr_files = []
+    for output_dir in sorted({db.get("output_dir") for db in db_list}):
+        if not is_valid_dir(f"{dir_name}/{output_dir}"):
+            continue
+        for file_name in sorted(os.listdir(f"{dir_name}/{output_dir}")):
+            output = f"{output_dir}/{file_name}"
+            if file_name.endswith(".dat") and output not in outputs:
+                ssr_files.append(output)
+    return ssr_files
+
+
+def report_diff(records, unconfigured, outfile):
+    """
+    Log a summary of the differences from the existing SSR files and write them as JSON to outfile
+    """
+    records = sorted(records, key=lambda record: (record.get("profile"), record.get("output")))
+    statuses = collections.Counter(record.get("status") for record in records)
+    for record in records:
+        if record.get("status") in ["new", "changed", "deleted"]:
+            logging.info(
+                f"{record.get('status'):>8} {record.get('output')} "
+                f"(+{len(record.get('added'))} -{len(record.get('removed'))})"
+            )
+    for profile_name, output in unconfigured:
+        logging.warning(f"Not configured: {output} ({profile_name})")
+
+    summary = {status: statuses[status] for status in ["new", "changed", "same", "deleted", "empty"]}
+    summary["added"] = sum(len(record.get("added")) for record in records)
+    summary["removed"] = sum(len(record.get("removed")) for record in records)
+    summary["not_configured"] = len(unconfigured)
+    logging.info(", ".join(f"{count} {key}" for key, count in summary.items()))
+
+    diff = {
+        "summary": summary,
+        "files": [
+            {key: record.get(key) for key in ["profile", "output", "status", "added", "removed"]}
+            for record in records
+            if record.get("status") in ["new", "changed", "deleted"]
+        ],
+        "not_configured": [{"profile": profile_name, "output": output} for profile_name, output in unconfigured],
+    }
+    json.dump(diff, outfile, indent=2)
+    outfile.write("\n")
+
+
+def wait_for_writes(records):
+    """
+    Wait until SSR files of given records are written by the writer and complete their records
+
+    Time spent by the writer is added to the write time of each record.
+    """
+    for record in records:
+        if isinstance(record["status"], concurrent.futures.Future):
+            written, write_time = record["status"].result()
+            record["status"] = "written" if written else "unchanged"
+            record["write"] += write_time
+
+
+def ssr_output_name(db):
+    """
+    Returns a path to the SSR file of a given SSR configuration relative to output directory
+    """
+    return f"{db.get('output_dir')}/{db.get('output')}.dat"
+
+
+def matches_output(db, patterns):
+    """
+    Returns True when the SSR file of a given SSR configuration matches any of given glob patterns
+
+    A pattern is matched against the path of the SSR file relative to output directory (e.g., bgksms/BGK-BMF.dat),
+    its file name (e.g., BGK-BMF.dat) and its file name without .dat (e.g., BGK-BMF).
+    """
+    names = [ssr_output_name(db), f"{db.get('output')}.dat", db.get("output")]
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns for name in names)
+
+
+def config_digest(db):
+    """
+    Returns SHA-256 digest of a given SSR configuration
+
+    The output profile is not part of the digest, as each output profile has its own manifest.
+    """
+    config = {key: value for key, value in db.items() if key != "profile"}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def points_digest(db_points):
+    """
+    Returns SHA-256 digest of a given set of database points
+    """
+    return hashlib.sha256("\n".join(sorted(db_points)).encode("utf-8")).hexdigest()
+
+
+def manifest_path(dir_name):
+    """
+    Returns a path to the manifest file written next to a given output directory
+    """
+    return f"{os.path.normpath(dir_name)}.manifest.json"
+
+
+def load_manifest(manifest_file):
+    """
+    Returns the manifest of a previous run, or an empty manifest when there is none
+    """
+    manifest = {"databases": {}, "outputs": {}}
+    try:
+        with open(manifest_file, "r") as infile:
+            manifest.update(json.load(infile))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {manifest_file}: {e}")
+    return manifest
+
+
+def save_manifest(manifest_file, manifest):
+    """
+    Write a manifest to a given file
+    """
+    temp_file = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    os.replace(temp_file, manifest_file)
+    logging.info(f"Manifest written to {manifest_file}")
+
+
+def manifest_record(record, db, digests):
+    """
+    Returns the manifest record of a SSR file from the record returned by a job
+    """
+    return {
+        "database": db.get("database"),
+        "database_sha256": digests[db.get("database")]["sha256"],
+        "config_sha256": config_digest(db),
+        "points": record.get("points"),
+        "points_sha256": record.get("points_sha256"),
+    }
+
+
+def database_digests(xml_dir, database_names, manifest):
+    """
+    Returns size, mtime and SHA-256 digest of instancesHierarchy.xml file of given databases
+
+    The digest recorded in the manifest is reused when size and mtime did not change.
+    """
+    digests = {}
+    for database in database_names:
+        xml_file = hierarchy_file(xml_dir, database)
+        try:
+            size, mtime = hierarchy_stat(xml_file)
+        except OSError:
+            logging.error(f"{xml_file} is not found")
+            continue
+        digest = {"size": size, "mtime": mtime, "sha256": None}
+
+        recorded = manifest["databases"].get(database, {})
+        # Peak memory usage measured by a previous run with --max-memory
+        if "footprint" in recorded:
+            digest["footprint"] = recorded["footprint"]
+            digest["footprint_size"] = recorded.get("footprint_size", digest["size"])
+        if recorded.get("size") == digest["size"] and recorded.get("mtime") == digest["mtime"]:
+            digest["sha256"] = recorded.get("sha256")
+        else:
+            digest["sha256"] = file_digest(xml_file)
+        digests[database] = digest
+    return digests
+
+
+def is_up_to_date(db, dir_name, manifest, digests):
+    """
+    Returns True when the SSR file of a given SSR configuration was generated from the same database
+    and the same configuration according to the manifest
+
+    SSR files of databases without instancesHierarchy.xml (not in digests) are never up to date.
+    """
+    output = ssr_output_name(db)
+    record = manifest["outputs"].get(output)
+    if record is None or db.get("database") not in digests:
+        return False
+    if record.get("database_sha256") != digests[db.get("database")]["sha256"]:
+        return False
+    if record.get("config_sha256") != config_digest(db):
+        return False
+    # SSR files without points are never written, and must not be left from an earlier run either
+    if record.get("points") == 0:
+        return not os.path.exists(f"{dir_name}/{output}")
+    return os.path.isfile(f"{dir_name}/{output}")
+
+
+def estimate_cost(job, digests):
+    """
+    Returns an estimated cost of a job, which is a database with its SSR configurations
+
+    Parsing a database and querying it for each SSR configuration scan the entire database,
+    so the cost is the size of the database times one more than the number of SSR configurations.
+    """
+    database, db_list = job
+    return digests[database]["size"] * (1 + len(db_list))
+
+
+def estimate_footprint(database, digests):
+    """
+    Returns the estimated peak memory usage (in MiB) of a worker process running a job of a database
+
+    Peak RSS measured by a previous run with --max-memory is scaled by the change of the database size.
+    Otherwise, the estimate is based on the size of its instancesHierarchy.xml file.
+    """
+    digest = digests[database]
+    if "footprint" in digest:
+        return digest["footprint"] * digest["size"] / max(digest["footprint_size"], 1)
+    return _worker_rss + _memory_factor * digest["size"] / (1024 * 1024)
+
+
+def schedule_jobs(jobs, digests, schedule="cost"):
+    """
+    Returns jobs in the order they are submitted to the pool
+
+    - "static" keeps the order of databases list
+    - "cost" submits the most expensive jobs first, so that workers are not left idle
+      while the largest databases (CMS and ECS) are processed at the end
+    """
+    if schedule == "static":
+        return jobs
+    return sorted(jobs, key=lambda job: estimate_cost(job, digests), reverse=True)
+
+
+def write_report(report_file, rows):
+    """
+    Write per SSR file performance report as CSV (when report_file ends with .csv) or JSON
+    """
+    with open(report_file, "w", newline="") as outfile:
+        if report_file.lower().endswith(".csv"):
+            writer = csv.DictWriter(outfile, fieldnames=_report_fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            rows = [{field: row.get(field) for field in _report_fields} for row in rows]
+            json.dump(rows, outfile, indent=2)
+    logging.info(f"Report written to {report_file}")
+
+
+def init_worker(log_queue):
+    """
+    Initialize a worker process to send its log records to the main process through log_queue
+
+    Workers ignore SIGINT, so that Ctrl-C (sent to the whole process group) only interrupts the main process,
+    which then terminates the pool.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger = logging.getLogger()
+    # Forked workers inherit handlers of the main process, which would write the same file concurrently
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.DEBUG)
+
+
+def run_job(job):
+    """
+    Run a job in a worker process
+
+    job is a tuple of a job name, a function, its arguments and a path to dump cProfile stats
+    (or "" not to profile). Returns the job name with the result of the function and None, or
+    with None and the traceback of an exception raised by the function.
+    """
+    job_name, work, work_args, profile_file = job
+    profiler = cProfile.Profile() if profile_file != "" else None
+    # Peak RSS of a worker is measured for each job, not for everything the worker has done before
+    reset_peak_rss()
+    try:
+        if profiler is None:
+            return job_name, work(*work_args), None
+        return job_name, profiler.runcall(work, *work_args), None
+    except Exception:
+        logging.exception(f"Job {job_name} failed")
+        return job_name, None, traceback.format_exc()
+    finally:
+        if profiler is not None:
+            profiler.dump_stats(profile_file)
+        rss = peak_rss()
+        if rss is not None:
+            logging.info(f"Peak RSS of worker {os.getpid()} during job {job_name}: {rss:0.1f} MiB")
+
+
+def run_jobs_within_memory(pool, pool_size, tasks, footprints, max_memory):
+    """
+    Run tasks in a pool and yield their results like Pool.imap_unordered(run_job, tasks), but start a task
+    only when the estimated footprints (in MiB) of the running tasks and the task fit into max_memory
+
+    Tasks are started in the given order, skipping the tasks that do not fit yet. A task that does not
+    fit even by itself is started when no other task is running.
+    """
+    results = queue.Queue()
+    pending = list(tasks)
+    running = {}
+    while pending or running:
+        for task in list(pending):
+            job_name = task[0]
+            if len(running) >= pool_size:
+                break
+            if running and sum(running.values()) + footprints[job_name] > max_memory:
+                continue
+            if footprints[job_name] > max_memory:
+                logging.warning(
+                    f"Job {job_name} is estimated to take {footprints[job_name]:0.1f} MiB, "
+                    f"more than --max-memory {max_memory} MiB"
+                )
+            pending.remove(task)
+            running[job_name] = footprints[job_name]
+            pool.apply_async(
+                run_job,
+                [task],
+                callback=results.put,
+                error_callback=lambda e, job_name=job_name: results.put((job_name, None, repr(e))),
+            )
+
+        result = results.get()
+        del running[result[0]]
+        yield result
+
+
+def log_progress(done, total, done_cost, total_cost, elapsed):
+    """
+    Log progress of jobs with an estimated time to complete the remaining jobs
+    """
+    eta = elapsed * (total_cost - done_cost) / done_cost if done_cost > 0 else 0.0
+    logging.info(
+        f"Progress: {done}/{total} jobs ({100 * done_cost / max(total_cost, 1):0.1f}%), "
+        f"elapsed {elapsed:0.1f}s, ETA {eta:0.1f}s"
+    )
+
+
+def profile_configs(profile_name):
+    """
+    Returns SSR configurations of a given output profile, each marked with the output profile
+    """
+    return [dict(db, profile=profile_name) for db in _profiles[profile_name]["databases"]]
+
+
+def group_by_database(db_list):
+    """
+    Returns SSR configurations grouped by their database, preserving the order of db_list
+    """
+    groups = {}
+    for db in db_list:
+        groups.setdefault(db.get("database"), []).append(db)
+    return groups
+
+
+def discover_systems(index, location_names):
+    """
+    Returns the number of input points of every system found under given locations in an indexed database
+
+    A system is a HierarchyItem directly under a HierarchyItem whose name is one of location_names.
+    The database is walked once; the result maps (location, system) to its number of input points.
+    """
+    systems = {}
+    ancestors = []  # (name, (location, system) of the enclosing system)
+    for depth, is_item, alias, name in index.walk():
+        del ancestors[depth:]
+
+        pair = ancestors[-1][1] if ancestors else None
+        if is_item and depth >= 2:
+            parent_name = ancestors[-1][0]
+            if parent_name in location_names:
+                pair = (parent_name, name)
+                systems.setdefault(pair, 0)
+            elif pair is not None and is_input_point(name):
+                systems[pair] += 1
+        ancestors.append((name if is_item else None, pair))
+    return {pair: count for pair, count in systems.items() if count > 0}
+
+
+def derive_config(database, location, system, static_list):
+    """
+    Returns a SSR configuration of a given system following the conventions of static_list
+
+    - "output_dir" is the one most used by the database
+    - "environ" is the one most used by the location in the database (or by the database)
+    - "output" is the location followed by the name most used for the system (e.g., CCTS_0001 => COM-CCTV)
+    """
+
+    def most_common(values, default):
+        values = list(values)
+        return collections.Counter(values).most_common(1)[0][0] if values else default
+
+    same_database = [db for db in static_list if db.get("database") == database]
+    same_location = [db for db in same_database if db.get("location") == location]
+    same_system = [db for db in static_list if db.get("system") == system and "-" in db.get("output")]
+
+    output_dir = most_common((db.get("output_dir") for db in same_database), f"{database.lower()}sms")
+    environ = most_common((db.get("environ") for db in same_location or same_database), f"{database}SMS")
+    suffix = most_common((db.get("output").split("-", 1)[1] for db in same_system), system)
+    return {
+        "database": database,
+        "environ": environ,
+        "location": location,
+        "system": system,
+        "output_dir": output_dir,
+        "output": f"{location}-{suffix}",
+    }
+
+
+def discover_configs(xml_dir, database_names, static_list, cache_dir=None, backend="etree", keep=False):
+    """
+    Returns SSR configurations of all systems with input points found in given databases
+
+    Databases are loaded by load_hierarchy() (from cache_dir when given). When keep is True, they are
+    kept as preloaded hierarchies, so that forked workers generate SSR files without loading them again.
+
+    Systems configured in static_list keep their configurations. Returns the configurations with
+    the discovered configurations missing from static_list and the configurations of static_list
+    that were not discovered.
+    """
+    location_names = {db.get("location") for db in static_list}
+    # The same system may be configured more than once (e.g., NDI-POW-HV.dat and NTS-POW-HV.dat)
+    static_configs = {}
+    for db in static_list:
+        static_configs.setdefault((db.get("database"), db.get("location"), db.get("system")), []).append(db)
+
+    db_list = []
+    new_list = []
+    for database in database_names:
+        index = load_hierarchy(xml_dir, database, cache_dir, backend)
+        if keep:
+            _preloaded_hierarchies[database] = index
+        logging.info(f"Discovering systems in {database} database ...")
+        for (location, system), count in discover_systems(index, location_names).items():
+            configs = static_configs.pop((database, location, system), None)
+            if configs is None:
+                db = derive_config(database, location, system, static_list)
+                new_list.append((db, count))
+                configs = [db]
+            db_list.extend(configs)
+
+    missing_list = [
+        db for configs in static_configs.values() for db in configs if db.get("database") in database_names
+    ]
+    return db_list, new_list, missing_list
+
+
+def do_work(
+    xml_dir, output_dirs, db, engine="tree", cache_dir=None, skip_unchanged=False, backend="etree", diff=False
+):
+    """
+    Performs work to create a SSR file from database data
+
+    output_dirs maps each output profile to its output directory. When diff is True, the SSR file is
+    compared with the existing one instead of being written.
+    """
+    # temporary variables
+    database = db.get("database")  # xml_DB_XXX
+    location = db.get("location")  # BGK, BNK, ..., NDI, NPS, etc
+    system = db.get("system")  # BMF, CCTS_0001, ..., SIG, etc
+
+    start_work = time.perf_counter()
+    logging.info(f"Processing {location}:{system} in {database} database ...")
+
+    records = []
+    for db, db_points, timings in collect_points(xml_dir, database, [db], engine, cache_dir, backend):
+        dir_name = output_dirs[db.get("profile", "station")]
+        if diff:
+            record = compare_ssr_file(db_points, dir_name, db, timings)
+        else:
+            record = output_ssr_file(db_points, dir_name, db, skip_unchanged, timings)
+        record.update(timings)
+        record["peak_rss"] = peak_rss()
+        records.append(record)
+
+    end_work = time.perf_counter()
+    logging.info(
+        f"Processing {location}:{system} in {database} database ... DONE ({end_work - start_work:0.4f}s)"
+    )
+    return records
+
+
+def do_database(
+    xml_dir,
+    output_dirs,
+    database,
+    db_list,
+    engine="tree",
+    cache_dir=None,
+    skip_unchanged=False,
+    backend="etree",
+    diff=False,
+):
+    """
+    Performs work to create all SSR files of a database from a single parse of its XML file
+
+    SSR files of all output profiles are created from the same parse. output_dirs maps each output
+    profile to its output directory. When diff is True, SSR files are compared with the existing ones
+    instead of being written.
+
+    SSR files are written by a writer thread, so that input points of the next SSR file are extracted
+    while the previous SSR file is being written.
+    """
+    start_database = time.perf_counter()
+    logging.info(f"Processing {len(db_list)} SSR files in {database} database ...")
+
+    results = collect_points(xml_dir, database, db_list, engine, cache_dir, backend)
+    records = output_database(output_dirs, database, results, skip_unchanged, diff)
+
+    end_database = time.perf_counter()
+    logging.info(
+        f"Processing {len(db_list)} SSR files in {database} database ... DONE ({end_database - start_database:0.4f}s)"
+    )
+    return records
+
+
+def output_database(output_dirs, database, results, skip_unchanged=False, diff=False):
+    """
+    Writes (or compares) SSR files of a database from results, which yields each SSR configuration
+    with its input points and timings, and returns their records
+    """
+    records = []
+    start_work = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as writer:
+        for db, db_points, timings in results:
+            location = db.get("location")
+            system = db.get("system")
+
+            dir_name = output_dirs[db.get("profile", "station")]
+            if diff:
+                record = compare_ssr_file(db_points, dir_name, db, timings)
+            else:
+                record = output_ssr_file(db_points, dir_name, db, skip_unchanged, timings, writer)
+            record.update(timings)
+            record["peak_rss"] = peak_rss()
+            records.append(record)
+
+            end_work = time.perf_counter()
+            logging.info(
+                f"Processing {location}:{system} in {database} database ... DONE ({end_work - start_work:0.4f}s)"
+            )
+            start_work = end_work
+        wait_for_writes(records)
+    return records
+
+
+def do_database_part(xml_dir, database, db_list, part, parts, cache_dir=None, backend="etree"):
+    """
+    Performs one part of the work of do_database() with walk engine, for a database split into parts
+
+    Finds input points of all SSR configurations of a database in the location subtrees (the outermost
+    HierarchyItem elements named after the locations of the SSR configurations) assigned to the part.
+    Returns the part with its input points (one list for each SSR configuration), timings and peak RSS,
+    which merge_database_parts() merges into SSR files once all parts are done.
+    """
+    start_part = time.perf_counter()
+    timings = new_timings()
+    index = load_hierarchy(xml_dir, database, cache_dir, backend)
+    timings["parse"] += time.perf_counter() - start_part
+
+    location_subtrees = index.location_subtrees({db.get("location") for db in db_list})
+    assigned = split_subtrees([size for _, size in location_subtrees], parts)[part]
+    subtrees = [location_subtrees[k][0] for k in sorted(assigned)]
+    logging.info(
+        f"Processing {len(subtrees)} of {len(location_subtrees)} location subtrees of {database} database "
+        f"(part {part + 1} of {parts}) ..."
+    )
+    all_points = route_points(index, db_list, timings, subtrees)
+
+    end_part = time.perf_counter()
+    logging.info(
+        f"Processing {len(subtrees)} of {len(location_subtrees)} location subtrees of {database} database "
+        f"(part {part + 1} of {parts}) ... "
+        f"DONE ({end_part - start_part:0.4f}s)"
+    )
+    return {"part": part, "points": all_points, "timings": timings, "peak_rss": peak_rss()}
+
+
+def merge_database_parts(output_dirs, database, db_list, part_results, skip_unchanged=False, diff=False):
+    """
+    Writes (or compares) SSR files of a database from the results of do_database_part() for all its parts
+
+    Input points of each SSR configuration are concatenated in the order of the parts, whatever order
+    the parts finished in. Timings of all parts are added up into the timings of the first SSR
+    configuration, and the peak RSS of each SSR file is the largest one of the parts.
+    """
+    part_results = sorted(part_results, key=lambda result: result["part"])
+    timings = new_timings()
+    for result in part_results:
+        for stage, value in result["timings"].items():
+            timings[stage] += value
+
+    def merged_points():
+        merged_timings = timings
+        for i, db in enumerate(db_list):
+            db_points = [point for result in part_results for point in result["points"][i]]
+            yield db, db_points, merged_timings
+            merged_timings = new_timings()
+
+    logging.info(f"Merging {len(part_results)} parts of {database} database into {len(db_list)} SSR files ...")
+    records = output_database(output_dirs, database, merged_points(), skip_unchanged, diff)
+    rss = [result["peak_rss"] for result in part_results if result["peak_rss"] is not None]
+    for record in records:
+        record["peak_rss"] = max(rss, default=None)
+    return records
+
+
+def watch_databases(xml_dir, output_dirs, db_list, manifests, digests, work_args, interval=2.0):
+    """
+    Regenerate SSR files of databases whose instancesHierarchy.xml changes until interrupted (Ctrl-C)
+
+    Databases are polled by their size and mtime every interval seconds. A changed database is processed
+    once it stays the same for one more interval, so that a file still being copied is not parsed.
+    Only SSR files of the changed database are generated, in the main process, which loads the changed
+    database again and drops its index once done. work_args are the engine, cache_dir, skip_unchanged and
+    backend arguments of do_database().
+    """
+    engine, cache_dir, skip_unchanged, backend = work_args
+    groups = group_by_database(db_list)
+    stats = {database: (digest["size"], digest["mtime"]) for database, digest in digests.items()}
+    changing = {}
+
+    logging.info(f"Watching {len(groups)} databases under {xml_dir} (Ctrl-C to stop) ...")
+    try:
+        while True:
+            time.sleep(interval)
+            for database, group in groups.items():
+                try:
+                    current = hierarchy_stat(hierarchy_file(xml_dir, database))
+                except OSError:
+                    continue
+                if current == stats.get(database):
+                    changing.pop(database, None)
+                    continue
+                if changing.get(database) != current:
+                    changing[database] = current
+                    continue
+                del changing[database]
+                stats[database] = current
+
+                start = time.perf_counter()
+                logging.info(f"{database} database changed")
+                # An index kept from the initial run (see --auto) is stale now
+                _preloaded_hierarchies.pop(database, None)
+                digests.update(database_digests(xml_dir, [database], {"databases": {}}))
+                try:
+                    reset_peak_rss()
+                    records = do_database(
+                        xml_dir, output_dirs, database, group, engine, cache_dir, skip_unchanged, backend
+                    )
+                except Exception:
+                    logging.exception(f"Generating SSR files of {database} database failed")
+                    continue
+
+                configs = {(db.get("profile"), ssr_output_name(db)): db for db in group}
+                for record in records:
+                    db = configs[(record.get("profile"), record.get("output"))]
+                    manifests[record.get("profile")]["outputs"][record.get("output")] = manifest_record(
+                        record, db, digests
+                    )
+                for profile_name, manifest in manifests.items():
+                    manifest["databases"][database] = digests[database]
+                    save_manifest(manifest_path(output_dirs[profile_name]), manifest)
+
+                statuses = collections.Counter(record.get("status") for record in records)
+                logging.info(
+                    f"{statuses['written']} SSR files written, {statuses['unchanged']} unchanged SSR files skipped, "
+                    f"{statuses['deleted']} SSR files without points removed "
+                    f"for {database} database ({time.perf_counter() - start:0.4f}s)"
+                )
+    except KeyboardInterrupt:
+        logging.info("Stopped watching databases")
+
+
+def main():
+    """
+    main function
+    """
+    init_logger()
+
+    parser = argparse.ArgumentParser(prog="generate-ssr4")
     parser.add_argument(
         "--xml-dir",
         "-x",
@@ -4007,45 +6108,490 @@ def main():
     parser.add_argument(
         "--output-dir",
         "-o",
-        required=True,
+        required=False,
+        default="",
         dest="output_dir",
-        help="path to output directory",
+        help="path to output directory (same as --output-profile station=OUTPUT_DIR)",
+    )
+    parser.add_argument(
+        "--output-profile",
+        required=False,
+        action="append",
+        default=[],
+        metavar="PROFILE=OUTPUT_DIR",
+        dest="output_profiles",
+        help=f"output profile ({', '.join(_profiles)}) and its output directory; can be repeated",
+    )
+    parser.add_argument(
+        "--diff",
+        "-d",
+        required=False,
+        default="",
+        dest="diff_dir",
+        help="path to existing SSR files (e.g., DatSsr) to report added and removed points of; "
+        "no SSR files are written, and the differences are written to standard output as JSON",
+    )
+    parser.add_argument(
+        "--only",
+        required=False,
+        action="append",
+        default=[],
+        metavar="OUTPUT",
+        dest="only",
+        help="only generate SSR files with a given name (e.g., BGK-COM-PIS.dat or bgksms/BGK-*.dat); "
+        "glob patterns are allowed, and can be repeated",
+    )
+    parser.add_argument(
+        "--group",
+        "-g",
+        required=False,
+        action="store_true",
+        dest="group",
+        help="parse each database once and generate all of its SSR files from it (one job per database)",
+    )
+    parser.add_argument(
+        "--auto",
+        "-a",
+        required=False,
+        action="store_true",
+        dest="auto",
+        help="discover SSR files from databases instead of using the configurations "
+        "and report the difference between them",
+    )
+    parser.add_argument(
+        "--engine",
+        required=False,
+        choices=["tree", "stream", "walk"],
+        default="tree",
+        dest="engine",
+        help="engine to extract input points (default=tree); "
+        "stream keeps memory usage flat on large databases, "
+        "walk finds input points of all SSR files of a database in one pass",
+    )
+    parser.add_argument(
+        "--split",
+        required=False,
+        type=int,
+        default=0,
+        dest="split",
+        help="split each database estimated to take longer than its share of --pool into this many jobs "
+        "(--group and walk engine)",
+    )
+    parser.add_argument(
+        "--xml-backend",
+        required=False,
+        choices=["auto", "etree", "lxml", "expat"],
+        default="auto",
+        dest="xml_backend",
+        help="XML library to parse databases with (default=auto); "
+        "auto uses lxml when it is installed, otherwise ElementTree (etree); "
+        "expat keeps databases in compact arrays",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        "-c",
+        required=False,
+        default="",
+        dest="cache_dir",
+        help="path to a directory to cache parsed databases (tree and walk engines); by default, no cache is used",
+    )
+    parser.add_argument(
+        "--incremental",
+        "-i",
+        required=False,
+        action="store_true",
+        dest="incremental",
+        help="only generate SSR files whose database or configuration changed since the previous run",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        "-s",
+        required=False,
+        action="store_true",
+        dest="skip_unchanged",
+        help="do not rewrite SSR files whose points did not change (ignoring the timestamp in the header)",
+    )
+    parser.add_argument(
+        "--prefork",
+        required=False,
+        action="store_true",
+        dest="prefork",
+        help="load all databases before starting worker processes "
+        "so that workers share them (tree and walk engines)",
+    )
+    parser.add_argument(
+        "--watch",
+        "-w",
+        required=False,
+        action="store_true",
+        dest="watch",
+        help="keep running after SSR files are generated and regenerate SSR files of databases that change",
+    )
+    parser.add_argument(
+        "--interval",
+        required=False,
+        type=float,
+        default=2.0,
+        dest="interval",
+        help="interval in seconds to check databases for changes with --watch (default=2.0)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        "-m",
+        required=False,
+        type=int,
+        default=0,
+        dest="max_memory",
+        help="memory in MiB that running jobs may take altogether; jobs are started as their estimated "
+        "peak memory fits, up to --pool jobs, and each worker process exits after its job",
+    )
+    parser.add_argument(
+        "--report",
+        "-r",
+        required=False,
+        default="",
+        dest="report",
+        help="path to a performance report of each SSR file (CSV when it ends with .csv; otherwise JSON)",
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        default="",
+        dest="profile",
+        help="path to a directory to dump cProfile stats of each job",
+    )
+    parser.add_argument(
+        "--schedule",
+        required=False,
+        choices=["cost", "static"],
+        default="cost",
+        dest="schedule",
+        help="order of jobs (default=cost); cost runs the largest databases first, "
+        "static keeps the order of the configurations",
     )
 
     args = parser.parse_args()
 
+    if args.diff_dir != "" and args.output_dir != "":
+        logging.error("--diff and --output-dir cannot be specified together")
+        return 1
+    if args.diff_dir != "" and args.watch:
+        logging.error("--diff and --watch cannot be specified together")
+        return 1
+
+    # Output directory of each output profile to be generated (or compared with --diff)
+    output_dirs = {}
+    if args.output_dir != "":
+        output_dirs["station"] = args.output_dir
+    if args.diff_dir != "":
+        output_dirs["station"] = args.diff_dir
+    for output_profile in args.output_profiles:
+        profile_name, _, dir_name = output_profile.partition("=")
+        if profile_name not in _profiles or dir_name == "":
+            logging.error(f"{output_profile} is not a valid output profile")
+            return 1
+        output_dirs[profile_name] = dir_name
+    if len(output_dirs) == 0:
+        logging.error("Either --output-dir or --output-profile must be specified")
+        return 1
+    if len({os.path.normpath(dir_name) for dir_name in output_dirs.values()}) < len(output_dirs):
+        logging.error("Each output profile must have its own output directory")
+        return 1
+
     # By default, when --environment is not specified, all environments are processed
-    db_list = databases
+    db_list = [db for profile_name in output_dirs for db in profile_configs(profile_name)]
     # When --environment is specified, only the specified environment is processed
     if args.environment != "":
         if not is_valid_environ(args.environment):
             logging.error(f"{args.environment} is not a valid environment")
-            return
-        db_list = [db for db in databases if db.get("database") == args.environment]
+            return 1
+        db_list = [db for db in db_list if db.get("database") == args.environment]
 
-    if not is_valid_dir(args.xml_dir):
-        logging.error(f"{args.xml_dir} is not a valid directory")
-        return
+    if not is_valid_dir(args.xml_dir) and not is_database_zip(args.xml_dir):
+        logging.error(f"{args.xml_dir} is not a valid directory or database zip file")
+        return 1
 
-    if not is_valid_dir(args.output_dir):
-        logging.error(f"{args.output_dir} is not a valid directory")
-        try:
-            os.mkdir(args.output_dir)
-        except OSError:
-            logging.error(f"Creation of the directory {args.output_dir} failed")
-            return
+    backend = resolve_backend(args.xml_backend)
+    if backend is None:
+        logging.error(f"{args.xml_backend} is not installed")
+        return 1
+
+    for dir_name in output_dirs.values():
+        if not is_valid_dir(dir_name):
+            logging.error(f"{dir_name} is not a valid directory")
+            if args.diff_dir != "":
+                return 1
+            try:
+                os.mkdir(dir_name)
+            except OSError:
+                logging.error(f"Creation of the directory {dir_name} failed")
+                return 1
+
+    for dir_name in [args.cache_dir, args.profile]:
+        if dir_name != "" and not is_valid_dir(dir_name):
+            try:
+                logging.info(f"Creating directory: {dir_name}")
+                os.mkdir(dir_name)
+            except OSError:
+                logging.error(f"Creation of the directory {dir_name} failed")
+                return 1
 
     start = time.perf_counter()
 
-    # FIXME Under macOS, for some reasons, logger does not output anything while performing the jobs via pool
-    pool = multiprocessing.Pool(args.pool)
-    [pool.apply_async(do_work, [args.xml_dir, args.output_dir, db]) for db in db_list]
-    pool.close()
-    pool.join()
+    if args.auto and "station" in output_dirs:
+        # Only SSR files of station output profile are discovered
+        station_list = [db for db in db_list if db.get("profile") == "station"]
+        database_names = [database for database in group_by_database(station_list).keys()]
+        database_names = [
+            database for database in database_names if hierarchy_exists(hierarchy_file(args.xml_dir, database))
+        ]
+        # Workers forked afterwards reuse the databases loaded for discovery, unless each job must load
+        # and release its own database (--max-memory) or does not use a loaded database (stream engine)
+        keep = (
+            args.engine in ["tree", "walk"]
+            and args.max_memory == 0
+            and multiprocessing.get_start_method() == "fork"
+        )
+        station_list, new_list, missing_list = discover_configs(
+            args.xml_dir, database_names, databases, args.cache_dir, backend, keep
+        )
+        if keep:
+            # Keep garbage collector from touching (and thus copying) the loaded databases in workers
+            gc.freeze()
+        station_list = [dict(db, profile="station") for db in station_list]
+        db_list = station_list + [db for db in db_list if db.get("profile") != "station"]
+        for db, count in new_list:
+            logging.info(
+                f"New: {db.get('location')}:{db.get('system')} in {db.get('database')} database "
+                f"({count} input points) => {ssr_output_name(db)}"
+            )
+        for db in missing_list:
+            logging.warning(
+                f"Not discovered: {db.get('location')}:{db.get('system')} in {db.get('database')} database "
+                f"=> {ssr_output_name(db)}"
+            )
+        logging.info(
+            f"{len(station_list)} SSR files discovered ({len(new_list)} new), "
+            f"{len(missing_list)} configured SSR files not discovered"
+        )
+
+    # SSR files not selected by --only are neither generated nor reported as not configured by --diff
+    configured_list = db_list
+    if len(args.only) > 0:
+        db_list = [db for db in db_list if matches_output(db, args.only)]
+        if len(db_list) == 0:
+            logging.error(f"No SSR file matches {', '.join(args.only)}")
+            return 1
+        for db in db_list:
+            logging.info(
+                f"Selected {ssr_output_name(db)} "
+                f"({db.get('location')}:{db.get('system')} in {db.get('database')} database)"
+            )
+
+    manifests = {profile_name: load_manifest(manifest_path(dir_name)) for profile_name, dir_name in output_dirs.items()}
+    recorded = {"databases": {}}
+    for manifest in manifests.values():
+        recorded["databases"].update(manifest["databases"])
+    digests = database_digests(args.xml_dir, group_by_database(db_list).keys(), recorded)
+
+    # All SSR files are watched, including those that are up to date now
+    watch_list = db_list
+    if args.incremental and args.diff_dir != "":
+        logging.warning("--incremental is ignored with --diff")
+    elif args.incremental:
+        total = len(db_list)
+        db_list = [
+            db
+            for db in db_list
+            if not is_up_to_date(db, output_dirs[db.get("profile")], manifests[db.get("profile")], digests)
+        ]
+        logging.info(f"{total - len(db_list)} of {total} SSR files are up to date")
+
+    if args.group:
+        jobs = list(group_by_database(db_list).items())
+    else:
+        jobs = [(db.get("database"), [db]) for db in db_list]
+    # Jobs of databases without instancesHierarchy.xml fail without being run
+    total_jobs = len(jobs)
+    failures = [
+        (database, "instancesHierarchy.xml is not found") for database, _ in jobs if database not in digests
+    ]
+    jobs = [job for job in jobs if job[0] in digests]
+    jobs = schedule_jobs(jobs, digests, args.schedule)
+
+    # A database that takes more than its share of the worker processes would be left running alone at the end,
+    # so it is split into jobs of its own
+    split_databases = {}
+    if args.split > 1 and (not args.group or args.engine != "walk"):
+        logging.warning("--split is ignored without --group and --engine walk")
+    elif args.split > 1 and args.cache_dir == "" and (not args.prefork or args.max_memory > 0):
+        # Every job would parse the whole database again, which takes longer than the walk it saves
+        logging.warning("--split is ignored without --prefork (and without --max-memory) or --cache-dir")
+    elif args.split > 1:
+        share = sum(estimate_cost(job, digests) for job in jobs) / args.pool
+        for database, group in jobs:
+            if estimate_cost((database, group), digests) > share:
+                split_databases[database] = group
+                logging.info(f"Splitting {database} database into {args.split} jobs")
+
+    if args.prefork and args.max_memory > 0:
+        logging.warning("--prefork is ignored with --max-memory, as each job loads and releases its own database")
+    elif args.prefork:
+        if args.engine in ["tree", "walk"]:
+            preload_hierarchies(args.xml_dir, [database for database, _ in jobs], args.cache_dir, backend)
+        else:
+            logging.warning(f"--prefork is ignored by {args.engine} engine")
+
+    tasks = []
+    costs = {}
+    footprints = {}
+    footprints_measured = {}
+    job_databases = {}
+    split_jobs = {}  # part of the split database that each job works on
+    split_results = {database: [] for database in split_databases}
+    for database, group in jobs:
+        if database in split_databases:
+            for part in range(args.split):
+                job_name = f"{database}-part{part + 1}of{args.split}"
+                work_args = [args.xml_dir, database, group, part, args.split, args.cache_dir, backend]
+                profile_file = f"{args.profile}/{job_name}.prof" if args.profile != "" else ""
+                tasks.append((job_name, do_database_part, work_args, profile_file))
+                costs[job_name] = estimate_cost((database, group), digests) / args.split
+                footprints[job_name] = estimate_footprint(database, digests)
+                job_databases[job_name] = database
+                split_jobs[job_name] = database
+            continue
+        if args.group:
+            work = do_database
+            work_args = [args.xml_dir, output_dirs, database, group]
+            job_name = database
+        else:
+            work = do_work
+            work_args = [args.xml_dir, output_dirs, group[0]]
+            job_name = f"{database}-{group[0].get('output_dir')}-{group[0].get('output')}"
+            if len(output_dirs) > 1:
+                job_name = f"{group[0].get('profile')}-{job_name}"
+        work_args += [args.engine, args.cache_dir, args.skip_unchanged, backend, args.diff_dir != ""]
+        profile_file = f"{args.profile}/{job_name}.prof" if args.profile != "" else ""
+        tasks.append((job_name, work, work_args, profile_file))
+        costs[job_name] = estimate_cost((database, group), digests)
+        footprints[job_name] = estimate_footprint(database, digests)
+        job_databases[job_name] = database
+
+    configs = {(db.get("profile"), ssr_output_name(db)): db for db in db_list}
+    statuses = collections.Counter()
+    report = []
+
+    # Workers send their log records to the main process, which writes them with its own handlers
+    log_queue = multiprocessing.Queue()
+    log_listener = logging.handlers.QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    log_listener.start()
+
+    total_cost = sum(costs.values())
+    done_cost = 0
+    if args.max_memory > 0:
+        # Each worker process exits after its job, so that its database is released as soon as the job finishes
+        pool = multiprocessing.Pool(args.pool, initializer=init_worker, initargs=[log_queue], maxtasksperchild=1)
+        logging.info(
+            f"Running jobs within {args.max_memory} MiB "
+            f"(largest job estimated at {max(footprints.values(), default=0):0.1f} MiB)"
+        )
+        results = run_jobs_within_memory(pool, args.pool, tasks, footprints, args.max_memory)
+    else:
+        pool = multiprocessing.Pool(args.pool, initializer=init_worker, initargs=[log_queue])
+        results = pool.imap_unordered(run_job, tasks)
+    try:
+        for done, (job_name, records, error) in enumerate(results, 1):
+            done_cost += costs[job_name]
+            log_progress(done, len(tasks), done_cost, total_cost, time.perf_counter() - start)
+            if error is not None:
+                failures.append((job_name, error.strip().splitlines()[-1]))
+                continue
+
+            if job_name in split_jobs:
+                # SSR files of a split database are written once all of its parts are done
+                database = split_jobs[job_name]
+                split_results[database].append(records)
+                if len(split_results[database]) < args.split:
+                    continue
+                records = merge_database_parts(
+                    output_dirs,
+                    database,
+                    split_databases[database],
+                    split_results.pop(database),
+                    args.skip_unchanged,
+                    args.diff_dir != "",
+                )
+
+            rss = [record.get("peak_rss") for record in records if record.get("peak_rss") is not None]
+            if args.max_memory > 0 and len(rss) > 0:
+                # Peak RSS of a worker process that ran only this job
+                database = job_databases[job_name]
+                footprints_measured[database] = max(rss + [footprints_measured.get(database, 0)])
+                digests[database].update(
+                    {"footprint": footprints_measured[database], "footprint_size": digests[database]["size"]}
+                )
+
+            for record in records:
+                db = configs[(record.get("profile"), record.get("output"))]
+                statuses[record.get("status")] += 1
+                row = {key: db.get(key) for key in ["database", "location", "system"]}
+                report.append(dict(record, **row))
+                if args.diff_dir != "":
+                    continue
+                manifests[record.get("profile")]["outputs"][record.get("output")] = manifest_record(record, db, digests)
+    except KeyboardInterrupt:
+        # Jobs still queued or running are abandoned; SSR files written so far are kept
+        pool.terminate()
+        pool.join()
+        logging.error("Interrupted")
+        return 130
+    except BaseException:
+        # Failed while collecting results; jobs still queued or running are abandoned
+        pool.terminate()
+        pool.join()
+        raise
+    else:
+        # Workers must exit normally to flush their log records when all jobs are done
+        pool.close()
+        pool.join()
+    finally:
+        log_listener.stop()
+
+    if args.diff_dir != "":
+        # SSR files that no SSR configuration of its output profile generates
+        unconfigured = []
+        for profile_name, dir_name in output_dirs.items():
+            profile_list = [db for db in configured_list if db.get("profile") == profile_name]
+            unconfigured.extend((profile_name, output) for output in unconfigured_ssr_files(dir_name, profile_list))
+        report_diff(report, unconfigured, sys.stdout)
+    else:
+        for profile_name, manifest in manifests.items():
+            manifest["databases"].update(digests)
+            save_manifest(manifest_path(output_dirs[profile_name]), manifest)
+        logging.info(
+            f"{statuses['written']} SSR files written, {statuses['unchanged']} unchanged SSR files skipped, "
+            f"{statuses['deleted']} SSR files without points removed, "
+            f"{statuses['empty']} SSR configurations without points"
+        )
+    if args.report != "":
+        write_report(args.report, report)
 
     end = time.perf_counter()
     logging.info(f"Total processing time: {end - start:0.4f} seconds")
 
+    if len(failures) > 0:
+        logging.error(f"{len(failures)} of {total_jobs} jobs failed:")
+        for job_name, error in failures:
+            logging.error(f"  {job_name}: {error}")
+
+    if args.watch:
+        work_args = [args.engine, args.cache_dir, args.skip_unchanged, backend]
+        watch_databases(args.xml_dir, output_dirs, watch_list, manifests, digests, work_args, args.interval)
+    return 1 if len(failures) > 0 else 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+
+#
+# README
+#
+# This Python script loads instancesHierarchy.xml files of a NELDB database into a SQLite file (a point catalog),
+# so that points can be looked up and SSR files can be generated with indexed SQL queries instead of
+# parsing XML files again.
+#
+# HOW TO USE:
+#
+# 1. Build a point catalog
+#
+#    $ python ssr-catalog.py build --xml-dir NELDB_MOCC_P22_P22/Database --catalog neldb.sqlite
+#
+#    The script loads every xml_DB_*/instancesHierarchy.xml file under --xml-dir (which can also be
+#    a compressed database file, e.g., NELDB_MOCC_P22_P22.zip). Specify `--environment` option to load
+#    specific databases only; can be repeated.
+#
+#    Every element becomes a row of "items" table with its database, alias, name, parent alias, location
+#    and system. As in generate-ssr.py --auto, a location is a HierarchyItem named after a location of
+#    the configurations (wherever it is) and a system is a HierarchyItem directly under a location; each
+#    element belongs to its nearest system. seq is the order of the element in its database and end_seq
+#    follows its last descendant, so descendants of an element are the rows between its seq and end_seq.
+#
+# 2. Find where a point is
+#
+#    $ python ssr-catalog.py find --catalog neldb.sqlite PGL_BMF_EQ000
+#    $ python ssr-catalog.py find --catalog neldb.sqlite "PGL_BMF_%:aiiTemp%"
+#
+#    The script prints the database, location, system and point (<parent alias>:<name>, as in SSR files) of
+#    HierarchyItem elements whose alias, name or point matches. A pattern with % is matched by SQL LIKE,
+#    which takes longer as every item is compared.
+#
+#    The catalog can also be queried by sqlite3 command directly:
+#
+#    $ sqlite3 neldb.sqlite "SELECT database, parent_alias FROM items WHERE alias = 'PGL_BMF_EQ000_aiiTemp1'"
+#
+# 3. Generate SSR files from a point catalog
+#
+#    $ python ssr-catalog.py generate --catalog neldb.sqlite --output-dir ssr-out
+#
+#    The script generates the same SSR files as generate-ssr.py, querying the catalog for the input points
+#    of each SSR file. Specify `--environment` option to generate SSR files of a specific database only.
+#
+
+import argparse
+import collections
+import importlib.util
+import logging
+import os
+import os.path
+import sqlite3
+import time
+
+logger = logging.getLogger("ssr-catalog")
+
+_schema = """
+CREATE TABLE databases (
+    database TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    items INTEGER NOT NULL
+);
+CREATE TABLE items (
+    database TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    end_seq INTEGER NOT NULL,
+    is_item INTEGER NOT NULL,
+    alias TEXT,
+    name TEXT,
+    parent_seq INTEGER,
+    parent_alias TEXT,
+    location TEXT,
+    system TEXT,
+    PRIMARY KEY (database, seq)
+);
+"""
+
+# Indexes are created after all items are inserted, which is faster than updating them for every item
+_indexes = """
+CREATE INDEX items_name ON items (name, database, seq);
+CREATE INDEX items_alias ON items (alias, database);
+"""
+
+# Number of items inserted at a time
+_batch_size = 10000
+
+
+def load_generate_ssr():
+    """
+    Load generate-ssr.py script from the same directory as a module
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate-ssr.py")
+    spec = importlib.util.spec_from_file_location("generate_ssr", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class CatalogIndex:
+    """
+    Index of a database in a point catalog, which answers the same queries as HierarchyIndex of generate-ssr.py
+    """
+
+    def __init__(self, connection, database):
+        self.connection = connection
+        self.database = database
+
+    def find_items(self, location, system):
+        """
+        Returns (alias, name) of all HierarchyItem elements under a given system of a given location
+
+        Items are found once for each pair of location and system ancestors, in the same order as
+        ElementTree finds them.
+        """
+        rows = self.connection.execute(
+            """
+            SELECT i.alias, i.name
+            FROM items AS l
+            JOIN items AS s ON s.name = ? AND s.database = l.database AND s.seq > l.seq AND s.seq < l.end_seq
+            JOIN items AS i ON i.database = s.database AND i.seq > s.seq AND i.seq < s.end_seq
+            WHERE l.name = ? AND l.database = ? AND l.seq > 0 AND l.is_item AND s.is_item AND i.is_item
+            ORDER BY l.seq, s.seq, i.seq
+            """,
+            (system, location, self.database),
+        )
+        return rows.fetchall()
+
+    def find_parents(self, alias):
+        """
+        Returns aliases of the parents of HierarchyItem elements with a given alias
+        """
+        rows = self.connection.execute(
+            """
+            SELECT DISTINCT parent_seq, parent_alias FROM items
+            WHERE alias = ? AND database = ? AND seq > 0 AND is_item
+            ORDER BY parent_seq
+            """,
+            (alias, self.database),
+        )
+        return [parent_alias for _, parent_alias in rows]
+
+
+def find_databases(ssr, xml_dir):
+    """
+    Returns names of all databases with instancesHierarchy.xml file under xml_dir (or in a database zip file)
+    """
+    if ssr.is_database_zip(xml_dir):
+        return sorted(ssr.zip_hierarchy_members(xml_dir).keys())
+    return sorted(
+        name[len("xml_DB_") :]
+        for name in os.listdir(xml_dir)
+        if name.startswith("xml_DB_") and os.path.isfile(f"{xml_dir}/{name}/instancesHierarchy.xml")
+    )
+
+
+def configured_locations(ssr):
+    """
+    Returns names of the locations of all SSR configurations of generate-ssr.py (all output profiles)
+    """
+    return {db.get("location") for profile in ssr._profiles.values() for db in profile["databases"]}
+
+
+def load_database(ssr, connection, xml_dir, database, locations):
+    """
+    Insert all elements of instancesHierarchy.xml file of a given database into a point catalog
+
+    The location and system of an element are those of its nearest system, a HierarchyItem directly
+    under a HierarchyItem named after one of given locations (same as discover_systems() of generate-ssr.py).
+    Elements are inserted after their end event, when their last descendant is known.
+    Returns the number of elements inserted.
+    """
+    xml_file = ssr.hierarchy_file(xml_dir, database)
+    logger.info(f"Loading {xml_file} ...")
+    start = time.perf_counter()
+
+    sql = "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    rows = []
+    ancestors = []  # rows of the current element and its ancestors
+    seq = 0
+    for event, elem in ssr.iterparse_hierarchy(xml_file):
+        if event == "end":
+            row = ancestors.pop()
+            row[2] = seq
+            rows.append(row)
+            if len(rows) >= _batch_size:
+                connection.executemany(sql, rows)
+                rows = []
+            continue
+
+        is_item = elem.tag == "HierarchyItem"
+        alias = elem.get("alias")
+        name = elem.get("name")
+        parent = ancestors[-1] if ancestors else None
+        location, system = (None, None) if parent is None else (parent[8], parent[9])
+        # The root element is never a location
+        if is_item and len(ancestors) >= 2 and parent[3] and parent[5] in locations:
+            location, system = parent[5], name
+        ancestors.append(
+            [
+                database,
+                seq,
+                None,
+                is_item,
+                alias,
+                name,
+                None if parent is None else parent[1],
+                None if parent is None else parent[4],
+                location,
+                system,
+            ]
+        )
+        seq += 1
+    connection.executemany(sql, rows)
+
+    connection.execute("INSERT INTO databases VALUES (?, ?, ?)", (database, ssr.file_digest(xml_file), seq))
+    logger.info(f"Loading {xml_file} ... DONE ({seq} elements, {time.perf_counter() - start:0.4f}s)")
+    return seq
+
+
+def build_catalog(ssr, xml_dir, catalog_file, database_names):
+    """
+    Build a point catalog of given databases
+
+    The catalog is built in a temporary file and renamed, so that a failed build never leaves
+    a partial catalog behind.
+    """
+    temp_file = f"{catalog_file}.{os.getpid()}.tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+
+    connection = sqlite3.connect(temp_file)
+    try:
+        # The temporary file is thrown away when anything fails, so there is nothing to journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(_schema)
+        total = 0
+        locations = configured_locations(ssr)
+        for database in database_names:
+            total += load_database(ssr, connection, xml_dir, database, locations)
+        logger.info("Creating indexes ...")
+        connection.executescript(_indexes)
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(temp_file, catalog_file)
+    logger.info(f"{total} elements of {len(database_names)} databases written to {catalog_file}")
+
+
+def find_points(connection, pattern):
+    """
+    Returns HierarchyItem elements whose alias, name or point (<parent alias>:<name>) matches a given pattern
+
+    A pattern without % is looked up through the indexes. Otherwise, it is matched by LIKE against all items.
+    """
+    columns = "database, location, system, parent_alias, alias, name"
+    if "%" not in pattern:
+        parent_alias, _, name = pattern.rpartition(":")
+        rows = connection.execute(
+            f"""
+            SELECT {columns} FROM items
+            WHERE is_item AND (alias = ?1 OR name = ?1 OR (name = ?3 AND parent_alias = ?2))
+            ORDER BY database, seq
+            """,
+            (pattern, parent_alias, name),
+        )
+        return rows.fetchall()
+
+    rows = connection.execute(
+        f"""
+        SELECT {columns} FROM items
+        WHERE is_item AND (alias LIKE ?1 OR name LIKE ?1 OR parent_alias || ':' || name LIKE ?1)
+        ORDER BY database, seq
+        """,
+        (pattern,),
+    )
+    return rows.fetchall()
+
+
+def generate_ssr_files(ssr, connection, output_dir, environment=""):
+    """
+    Generate SSR files of generate-ssr.py configurations from a point catalog
+    """
+    loaded = {database for (database,) in connection.execute("SELECT database FROM databases")}
+    db_list = ssr.profile_configs("station")
+    if environment != "":
+        db_list = [db for db in db_list if db.get("database") == environment]
+
+    start = time.perf_counter()
+    statuses = collections.Counter()
+    for database, group in ssr.group_by_database(db_list).items():
+        if database not in loaded:
+            logger.error(f"{database} database is not in the catalog")
+            statuses["missing"] += len(group)
+            continue
+
+        index = CatalogIndex(connection, database)
+        for db in group:
+            db_points = ssr.extract_points(index, db)
+            record = ssr.output_ssr_file(db_points, output_dir, db)
+            statuses[record.get("status")] += 1
+
+    logger.info(
+        f"{statuses['written']} SSR files written, {statuses['deleted']} SSR files without points removed, "
+        f"{statuses['empty']} SSR configurations without points, "
+        f"{statuses['missing']} SSR configurations of missing databases ({time.perf_counter() - start:0.4f}s)"
+    )
+
+
+def main():
+    """
+    main function
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(prog="ssr-catalog")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build a point catalog from instancesHierarchy.xml files")
+    find_parser = subparsers.add_parser("find", help="find points in a point catalog")
+    generate_parser = subparsers.add_parser("generate", help="generate SSR files from a point catalog")
+    for subparser in [build_parser, find_parser, generate_parser]:
+        subparser.add_argument(
+            "--catalog",
+            "-c",
+            required=True,
+            dest="catalog",
+            help="path to a point catalog (SQLite file)",
+        )
+    build_parser.add_argument(
+        "--xml-dir",
+        "-x",
+        required=True,
+        dest="xml_dir",
+        help="path to XML directories (or a database zip file)",
+    )
+    build_parser.add_argument(
+        "--environment",
+        "-e",
+        required=False,
+        action="append",
+        dest="environments",
+        help="specific database to be loaded (e.g., CMS); can be repeated (default=all databases)",
+    )
+    find_parser.add_argument(
+        "pattern",
+        help="alias, name or point to be found; % matches any characters",
+    )
+    generate_parser.add_argument(
+        "--output-dir",
+        "-o",
+        required=True,
+        dest="output_dir",
+        help="path to output directory",
+    )
+    generate_parser.add_argument(
+        "--environment",
+        "-e",
+        required=False,
+        default="",
+        dest="environment",
+        help="specific environment to be processed (e.g., CMS); by default, all environments are processed",
+    )
+
+    args = parser.parse_args()
+
+    ssr = load_generate_ssr()
+    # Keep the log of each SSR file written by generate-ssr.py from flooding the output
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    if args.command == "build":
+        if not ssr.is_valid_dir(args.xml_dir) and not ssr.is_database_zip(args.xml_dir):
+            logger.error(f"{args.xml_dir} is not a valid directory or database zip file")
+            return
+        database_names = find_databases(ssr, args.xml_dir)
+        if args.environments:
+            database_names = [database for database in database_names if database in args.environments]
+        build_catalog(ssr, args.xml_dir, args.catalog, database_names)
+        return
+
+    if not os.path.isfile(args.catalog):
+        logger.error(f"{args.catalog} is not found")
+        return
+    connection = sqlite3.connect(f"file:{args.catalog}?mode=ro", uri=True)
+    try:
+        if args.command == "find":
+            rows = find_points(connection, args.pattern)
+            for database, location, system, parent_alias, alias, name in rows:
+                print(f"{database}\t{location}\t{system}\t{parent_alias}:{name}\t{alias}")
+            logger.info(f"{len(rows)} items found")
+            return
+
+        if not ssr.is_valid_dir(args.output_dir):
+            logger.error(f"{args.output_dir} is not a valid directory")
+            return
+        generate_ssr_files(ssr, connection, args.output_dir, args.environment)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()